@@ -0,0 +1,23 @@
+from pathlib import Path
+from choice_models.nb_trips.apply_home_work_model_to_synthetic_population import \
+    apply_home_work_model_to_synthetic_population
+from choice_models.nb_trips.model_artifact import get_betas_and_specification
+
+
+def apply_model_to_synthetic_population(betas=None, specification=None, chunk_size=1000000, nb_of_processes=None):
+    """ Apply the model of the number of trips from home to work to the synthetic population, chunk by chunk.
+    :param betas: Dictionary with the values of the betas (None: betas of the estimation on the MTMC)
+    :param specification: Specification the betas were estimated with (None, with betas None: the one of the
+    estimation on the MTMC, see model_artifact.get_betas_and_specification)
+    :param chunk_size: Number of persons simulated at once
+    :param nb_of_processes: Number of processes simulating chunks at the same time (None: number of CPUs)
+    """
+    betas, specification = get_betas_and_specification(betas, specification)
+    folder_path = Path('../data/input/synpop/2017/')
+    output_directory = Path('../data/output/models/nb_trips/WA/synthetic_population/')
+    nb_of_persons = apply_home_work_model_to_synthetic_population(folder_path / 'persons.csv',
+                                                                  folder_path / 'households.csv',
+                                                                  output_directory / 'persons_with_nb_trips.csv',
+                                                                  betas, specification, chunk_size=chunk_size,
+                                                                  nb_of_processes=nb_of_processes)
+    print('Number of trips to work simulated for', nb_of_persons, 'persons of the synthetic population')
@@ -0,0 +1,167 @@
+import numpy as np
+from pathlib import Path
+from scipy.special import expit
+from choice_models.nb_trips.home_work_specification import get_thresholds, get_threshold_parameters
+from choice_models.nb_trips.ordered_logit import ALTERNATIVES, logistic_cdf, get_utilities
+from choice_models.nb_trips.model_artifact import get_betas_and_specification
+from choice_models.nb_trips.apply_home_work_model_to_synthetic_population import read_population_in_chunks, \
+    prepare_chunk
+from features.business_sectors import add_business_sectors
+from utils_mtmc.nb_trips_schema import read_nb_trips
+
+PATH_TO_ESTIMATION_FOLDER = Path('../data/output/models/nb_trips/WA/estimation/')
+PATH_TO_NB_TRIPS = Path('../data/output/data/estimation/nb_trips.csv')
+PATH_TO_SYNTHETIC_POPULATION = Path('../data/input/synpop/2017/')
+''' Largest change of a threshold in one Newton iteration, as long as the solution is not bracketed '''
+MAX_NEWTON_STEP = 5.0
+
+
+def calibrate_the_cuts_from_microcensus(betas=None, specification=None, tolerance=1e-10,
+                                        max_nb_of_iterations=100):
+    """ Calibrate the thresholds (cuts) tau1 to tau4 of the ordered logit so that the weighted shares of 0, 1, 2, 3 and
+    4+ trips from home to work predicted for the adults of the MTMC (more than 14 years old, see
+    apply_home_work_model_to_microcensus) are the observed shares. The other betas are not changed.
+    :param betas: Dictionary with the values of the betas (None: betas of the estimation on the MTMC)
+    :param specification: Specification the betas were estimated with (None, with betas None: the one of the
+    estimation on the MTMC, see model_artifact.get_betas_and_specification)
+    :return: The betas with the calibrated tau1, delta2, delta3 and delta4, e.g., for
+    apply_home_work_model_to_microcensus(betas=..., specification=...), with the same specification
+    """
+    betas, specification = get_betas_and_specification(betas, specification, PATH_TO_ESTIMATION_FOLDER,
+                                                       path_to_data=PATH_TO_NB_TRIPS)
+    df_adults = get_adults_of_microcensus()
+    weights = df_adults['WP'].to_numpy(dtype=float)
+    target_shares = get_observed_shares(df_adults['WA'].to_numpy(), weights)
+    utilities = get_utilities(df_adults, betas, specification)
+    return calibrate_the_cuts(utilities, target_shares, betas, weights=weights, tolerance=tolerance,
+                              max_nb_of_iterations=max_nb_of_iterations)
+
+
+def calibrate_the_cuts_from_synthetic_population(betas=None, target_shares=None, path_to_persons=None,
+                                                 path_to_households=None, household_id='household_id',
+                                                 chunk_size=1000000, columns_to_rename=None, sep=',',
+                                                 specification=None, tolerance=1e-10,
+                                                 max_nb_of_iterations=100):
+    """ Calibrate the thresholds (cuts) tau1 to tau4 of the ordered logit so that the shares of 0, 1, 2, 3 and 4+ trips
+    from home to work predicted for the adults of the synthetic population are the target shares. The utilities of
+    the persons are computed once, chunk by chunk (see apply_home_work_model_to_synthetic_population), and only the
+    array of utilities is kept in memory during the calibration.
+    :param betas: Dictionary with the values of the betas (None: betas of the estimation on the MTMC)
+    :param specification: Specification the betas were estimated with (None, with betas None: the one of the
+    estimation on the MTMC, see model_artifact.get_betas_and_specification)
+    :param target_shares: Array with the shares of 0, 1, 2, 3 and 4+ trips (None: weighted shares observed for the
+    adults of the MTMC)
+    :param path_to_persons: CSV file of the persons, sorted by household_id (None: persons.csv of the synthetic
+    population 2017)
+    :param path_to_households: CSV file of the households, sorted by household_id (None: households.csv of the
+    synthetic population 2017)
+    :return: The betas with the calibrated tau1, delta2, delta3 and delta4, e.g., for
+    apply_model_to_synthetic_population(betas, specification), with the same specification
+    """
+    betas, specification = get_betas_and_specification(betas, specification, PATH_TO_ESTIMATION_FOLDER)
+    if target_shares is None:
+        df_adults = get_adults_of_microcensus()
+        target_shares = get_observed_shares(df_adults['WA'].to_numpy(), df_adults['WP'].to_numpy(dtype=float))
+    if path_to_persons is None:
+        path_to_persons = PATH_TO_SYNTHETIC_POPULATION / 'persons.csv'
+    if path_to_households is None:
+        path_to_households = PATH_TO_SYNTHETIC_POPULATION / 'households.csv'
+    list_of_utilities = []
+    for df_chunk in read_population_in_chunks(path_to_persons, path_to_households, household_id=household_id,
+                                              chunk_size=chunk_size, sep=sep):
+        df_chunk = prepare_chunk(df_chunk, household_id, columns_to_rename)
+        list_of_utilities.append(get_utilities(df_chunk[df_chunk['age'] > 14], betas, specification))
+    utilities = np.concatenate(list_of_utilities)
+    return calibrate_the_cuts(utilities, target_shares, betas, tolerance=tolerance,
+                              max_nb_of_iterations=max_nb_of_iterations)
+
+
+def calibrate_the_cuts(utilities, target_shares, betas, weights=None, tolerance=1e-10, max_nb_of_iterations=100):
+    """ Betas with thresholds calibrated on target shares (see calibrate_thresholds), with a comparison of the
+    predicted shares before and after the calibration """
+    thresholds = calibrate_thresholds(utilities, target_shares, weights=weights,
+                                      starting_thresholds=get_thresholds(betas), tolerance=tolerance,
+                                      max_nb_of_iterations=max_nb_of_iterations)
+    calibrated_betas = {**betas, **get_threshold_parameters(thresholds)}
+    print('Alternative:', ALTERNATIVES)
+    print('Target shares:', np.round(target_shares, 4))
+    print('Predicted shares before calibration:',
+          np.round(get_predicted_shares(utilities, get_thresholds(betas), weights), 4))
+    print('Predicted shares after calibration:', np.round(get_predicted_shares(utilities, thresholds, weights), 4))
+    return calibrated_betas
+
+
+def calibrate_thresholds(utilities, target_shares, weights=None, starting_thresholds=None, tolerance=1e-10,
+                         max_nb_of_iterations=100):
+    """ Thresholds tau1 to tau4 such that the weighted shares of the alternatives predicted by the ordered logit are
+    the target shares. The predicted share of more than k - 1 trips is the weighted average of F(U - tau_k) (F: logistic
+    CDF), which only depends on tau_k and decreases with it: each threshold is the root of a monotone function of one
+    variable. The four roots are found at the same time with Newton iterations over the precomputed utilities,
+    safeguarded by bisection once the root is bracketed. Since the target shares of more than k - 1 trips decrease
+    with k, the thresholds increase (the deltas are positive).
+    :param utilities: Array with the linear utility of each person (see ordered_logit.get_utilities)
+    :param target_shares: Array with the target shares of 0, 1, 2, 3 and 4+ trips (positive, sum of 1)
+    :param weights: Weight of each person (None: 1 for all persons)
+    :param starting_thresholds: Thresholds of the first iteration (None: 0)
+    :param tolerance: Largest difference between the predicted and the target shares
+    :return: An array with the four thresholds
+    """
+    target_shares = np.asarray(target_shares, dtype=float)
+    if len(target_shares) != len(ALTERNATIVES) or np.any(target_shares <= 0.0) or \
+            not np.isclose(target_shares.sum(), 1.0):
+        raise Exception('Target shares not well defined: ' + str(target_shares))
+    if weights is None:
+        weights = np.ones(len(utilities))
+    weights = np.asarray(weights, dtype=float) / np.sum(weights)
+    utilities = np.asarray(utilities, dtype=float)
+    ''' Target share of more than k - 1 trips, for k = 1 to 4 '''
+    target_cumulative_shares = np.cumsum(target_shares[::-1])[::-1][1:]
+    thresholds = np.zeros(4) if starting_thresholds is None else np.array(starting_thresholds, dtype=float)
+    lower_bounds = np.full(4, -np.inf)
+    upper_bounds = np.full(4, np.inf)
+    for iteration in range(max_nb_of_iterations):
+        ''' One row per threshold (contiguous in memory), computed with the logistic CDF of scipy (faster) '''
+        cdf = expit(utilities[np.newaxis, :] - thresholds[:, np.newaxis])
+        differences = cdf @ weights - target_cumulative_shares
+        if np.max(np.abs(differences)) < tolerance:
+            return thresholds
+        ''' The predicted share is too high if the threshold is too low '''
+        lower_bounds = np.where(differences > 0.0, np.maximum(lower_bounds, thresholds), lower_bounds)
+        upper_bounds = np.where(differences < 0.0, np.minimum(upper_bounds, thresholds), upper_bounds)
+        derivatives = (cdf * (1.0 - cdf)) @ weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            steps = np.clip(differences / derivatives, -MAX_NEWTON_STEP, MAX_NEWTON_STEP)
+        new_thresholds = thresholds + np.where(np.isfinite(steps), steps, np.sign(differences) * MAX_NEWTON_STEP)
+        is_bracketed = np.isfinite(lower_bounds) & np.isfinite(upper_bounds)
+        is_outside = (new_thresholds <= lower_bounds) | (new_thresholds >= upper_bounds)
+        thresholds = np.where(is_bracketed & is_outside, (lower_bounds + upper_bounds) / 2.0, new_thresholds)
+    print('WARNING: Calibration of the thresholds did not converge after', max_nb_of_iterations, 'iterations')
+    return thresholds
+
+
+def get_predicted_shares(utilities, thresholds, weights=None):
+    """ Weighted shares of 0, 1, 2, 3 and 4+ trips predicted by the ordered logit """
+    if weights is None:
+        weights = np.ones(len(utilities))
+    cumulative_shares = np.asarray(weights, dtype=float) @ logistic_cdf(utilities[:, np.newaxis] -
+                                                                        np.asarray(thresholds)[np.newaxis, :])
+    cumulative_shares = np.concatenate([[1.0], cumulative_shares / np.sum(weights), [0.0]])
+    return cumulative_shares[:-1] - cumulative_shares[1:]
+
+
+def get_observed_shares(nb_of_trips, weights=None):
+    """ Weighted shares of 0, 1, 2, 3 and 4+ trips from home to work """
+    if weights is None:
+        weights = np.ones(len(nb_of_trips))
+    nb_of_trips = np.clip(np.asarray(nb_of_trips).astype(np.int64), 0, ALTERNATIVES[-1])
+    sums_of_weights = np.bincount(nb_of_trips, weights=weights, minlength=len(ALTERNATIVES))
+    return sums_of_weights / sums_of_weights.sum()
+
+
+def get_adults_of_microcensus():
+    """ Persons of the MTMC (nb_trips.csv) more than 14 years old, with the business sectors """
+    df_nb_trips = read_nb_trips(PATH_TO_NB_TRIPS)
+    if 'noga_08' in df_nb_trips:
+        ''' Data files with NOGA codes instead of business sectors (the data file of the MTMC has the sectors) '''
+        df_nb_trips = add_business_sectors(df_nb_trips, noga_column='noga_08')
+    return df_nb_trips[df_nb_trips['age'] > 14]
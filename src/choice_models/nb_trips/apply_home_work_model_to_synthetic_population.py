@@ -0,0 +1,126 @@
+import pandas as pd
+from functools import partial
+from choice_models.nb_trips.ordered_logit import simulate_ordered_logit, ALTERNATIVES
+from choice_models.nb_trips.parallel_scoring import map_in_order
+from features.household_composition import add_household_composition
+from features.business_sectors import add_business_sectors
+from utils_mtmc.nb_trips_schema import apply_nb_trips_schema
+
+
+def apply_home_work_model_to_synthetic_population(path_to_persons, path_to_households, output_file, betas,
+                                                  specification, household_id='household_id', person_id='person_id',
+                                                  chunk_size=1000000, columns_to_rename=None, sep=',',
+                                                  nb_of_processes=1):
+    """ Apply the ordered logit of the number of trips from home to work to a synthetic population, chunk by chunk.
+    The persons are read in chunks of chunk_size rows and joined to their household. The features are computed, the
+    model is applied with NumPy and the probabilities are appended to output_file, so that the memory used depends on
+    chunk_size and not on the size of the population.
+    :param path_to_persons: CSV file with one row per person, sorted by household_id
+    :param path_to_households: CSV file with one row per household, sorted by household_id (None: no household file)
+    :param output_file: CSV file (separator: ;) with person_id, household_id, the probabilities of 0, 1, 2, 3 and 4+
+    trips and the expected number of trips
+    :param betas: Dictionary with the values of the betas
+    :param specification: Specification the betas were estimated with (see model_artifact.get_model)
+    :param household_id: Column identifying the household in both files
+    :param person_id: Column identifying the person
+    :param chunk_size: Number of persons read at once
+    :param columns_to_rename: Dictionary renaming the columns of the synthetic population to the names of the data file
+    of the MTMC (nb_trips.csv), e.g., {'noga': 'noga_08'}
+    :param sep: Separator of the input files
+    :param nb_of_processes: Number of processes simulating chunks at the same time (None: number of CPUs). The chunks
+    are written in the order of the input files.
+    :return: The number of persons simulated
+    """
+    chunks = read_population_in_chunks(path_to_persons, path_to_households, household_id=household_id,
+                                       chunk_size=chunk_size, sep=sep)
+    simulate = partial(simulate_chunk, household_id=household_id, person_id=person_id,
+                       columns_to_rename=columns_to_rename)
+    if nb_of_processes == 1:
+        list_of_results = (simulate(df_chunk, betas, specification) for df_chunk in chunks)
+    else:
+        list_of_results = map_in_order(simulate, chunks, betas, specification, nb_of_processes=nb_of_processes)
+    nb_of_persons = 0
+    for df_results in list_of_results:
+        df_results.to_csv(output_file, sep=';', index=False, mode='w' if nb_of_persons == 0 else 'a',
+                          header=nb_of_persons == 0)
+        nb_of_persons += len(df_results)
+    return nb_of_persons
+
+
+def simulate_chunk(df_chunk, betas, specification, household_id, person_id, columns_to_rename=None):
+    df_chunk = prepare_chunk(df_chunk, household_id, columns_to_rename)
+    df_results = simulate_ordered_logit(df_chunk, betas, specification)
+    ''' Children 14 years old and younger: we assume that they do 0 trips to work '''
+    is_child = df_chunk['age'].to_numpy() <= 14
+    for alternative in ALTERNATIVES:
+        df_results.loc[is_child, alternative] = 1.0 if alternative == 0 else 0.0
+    df_results.loc[is_child, 'expected nb of trips'] = 0.0
+    df_results.insert(0, household_id, df_chunk[household_id].to_numpy())
+    df_results.insert(0, person_id, df_chunk[person_id].to_numpy())
+    return df_results
+
+
+def prepare_chunk(df_chunk, household_id, columns_to_rename=None):
+    """ Columns of the data file of the MTMC (nb_trips.csv) used by the model, for a chunk of persons """
+    if columns_to_rename is not None:
+        df_chunk = df_chunk.rename(columns=columns_to_rename)
+    if 'nb_less_than_6_in_hh' not in df_chunk:
+        ''' All members of a household are in the same chunk (see read_population_in_chunks) '''
+        df_chunk = add_household_composition(df_chunk, df_chunk, household_id=household_id, age='age')
+    if 'noga_08' in df_chunk:
+        df_chunk = add_business_sectors(df_chunk, noga_column='noga_08')
+    return apply_nb_trips_schema(df_chunk)
+
+
+def read_population_in_chunks(path_to_persons, path_to_households=None, household_id='household_id',
+                              chunk_size=1000000, sep=','):
+    """ Read the persons in chunks of about chunk_size rows, joined to their household. Both files must be sorted by
+    household_id. The persons of the last household of a chunk are kept for the next chunk, so that a household is
+    never split between two chunks, and only the households of the current chunk are kept in memory.
+    :return: A generator of dataframes
+    """
+    persons_reader = pd.read_csv(path_to_persons, sep=sep, chunksize=chunk_size)
+    households_reader = None
+    if path_to_households is not None:
+        households_reader = pd.read_csv(path_to_households, sep=sep, chunksize=chunk_size)
+    df_households_buffer = None
+    df_remaining_persons = None
+    for df_persons in persons_reader:
+        if df_remaining_persons is not None:
+            df_persons = pd.concat([df_remaining_persons, df_persons], ignore_index=True)
+        is_in_last_household = df_persons[household_id] == df_persons[household_id].iloc[-1]
+        df_remaining_persons = df_persons[is_in_last_household]
+        df_persons = df_persons[~is_in_last_household]
+        if len(df_persons) == 0:
+            continue
+        if households_reader is not None:
+            df_households, df_households_buffer = get_households_up_to(df_persons[household_id].iloc[-1],
+                                                                       households_reader, df_households_buffer,
+                                                                       household_id)
+            df_persons = pd.merge(df_persons, df_households, on=household_id, how='left')
+        yield df_persons
+    if df_remaining_persons is not None and len(df_remaining_persons) > 0:
+        if households_reader is not None:
+            df_households, df_households_buffer = get_households_up_to(df_remaining_persons[household_id].iloc[-1],
+                                                                       households_reader, df_households_buffer,
+                                                                       household_id)
+            df_remaining_persons = pd.merge(df_remaining_persons, df_households, on=household_id, how='left')
+        yield df_remaining_persons
+
+
+def get_households_up_to(last_household_id, households_reader, df_households_buffer, household_id):
+    """ Read the households until last_household_id.
+    :return: The households up to last_household_id (included) and the households already read after it
+    """
+    list_of_households = [] if df_households_buffer is None else [df_households_buffer]
+    while not list_of_households or len(list_of_households[-1]) == 0 or \
+            list_of_households[-1][household_id].iloc[-1] < last_household_id:
+        df_next_households = next(households_reader, None)
+        if df_next_households is None:
+            break
+        list_of_households.append(df_next_households)
+    if not list_of_households:
+        raise Exception('Households not found in the file of households, up to ' + str(last_household_id))
+    df_households = pd.concat(list_of_households, ignore_index=True)
+    is_read = df_households[household_id] <= last_household_id
+    return df_households[is_read], df_households[~is_read]
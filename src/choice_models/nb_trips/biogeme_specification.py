@@ -0,0 +1,79 @@
+import pandas as pd
+import biogeme.database as db
+import biogeme.distributions as dist
+from biogeme.expressions import Beta, Variable
+from choice_models.nb_trips.home_work_specification import THRESHOLD_PARAMETERS, get_free_terms, get_design_matrix
+from choice_models.nb_trips.compression import compress_dataframe
+
+
+def get_database_and_utility(df, specification, database_name, other_columns=None, starting_values=None):
+    """ Build the Biogeme database and utility of a specification (see home_work_specification).
+    Terms whose beta is fixed at zero are dropped before building the Biogeme objects: the database only contains the
+    features of the free betas (computed with NumPy) and the other columns, and the utility only their terms.
+    :param df: Data with the columns of nb_trips.csv
+    :param specification: List of terms (beta, feature) or (beta, feature, status)
+    :param database_name: Name of the Biogeme database
+    :param other_columns: Columns of df to add to the database, e.g., ['WA']
+    :param starting_values: Dictionary of starting values of the betas (default: 0)
+    :return: The Biogeme database and the utility
+    """
+    database = db.Database(database_name, get_features(df, specification, other_columns))
+    return database, get_utility(specification, starting_values)
+
+
+def get_compressed_database_and_utility(df, specification, database_name, other_columns=None, starting_values=None):
+    """ Same as get_database_and_utility, with one row per pattern of features and other columns in the database
+    (see compression). The number of rows of each pattern is in the column 'weight' of the database, e.g., for the
+    estimation with the weights {'loglike': ..., 'weight': Variable('weight')}.
+    :return: The Biogeme database, the utility and the pattern of each row of df (to expand the results of
+    biogeme.simulate with compression.expand_dataframe)
+    """
+    df_features, inverse = compress_dataframe(get_features(df, specification, other_columns))
+    database = db.Database(database_name, df_features)
+    return database, get_utility(specification, starting_values), inverse
+
+
+def get_features(df, specification, other_columns=None):
+    """ Features of the free betas of the specification (computed with NumPy) and the other columns of df """
+    free_terms = get_free_terms(specification)
+    beta_names, design_matrix = get_design_matrix(df, free_terms)
+    feature_names = [feature_name for beta_name, feature_name in free_terms]
+    df_features = pd.DataFrame(design_matrix, columns=feature_names, index=df.index)
+    if other_columns is not None:
+        df_features = pd.concat([df_features, df[other_columns]], axis=1)
+    return df_features
+
+
+def get_utility(specification, starting_values=None):
+    """ Utility of the free betas of the specification """
+    if starting_values is None:
+        starting_values = {}
+    return sum(Beta(beta_name, starting_values.get(beta_name, 0), None, None, 0) * Variable(feature_name)
+               for beta_name, feature_name in get_free_terms(specification))
+
+
+def get_choice_probabilities(utility, tau1_upper_bound, starting_values=None):
+    """ Probabilities of 0, 1, 2, 3 and 4+ trips of the ordered logit, with the thresholds tau1 (lower than
+    tau1_upper_bound) and tau_k = tau_(k-1) + delta_k (delta_k >= 0) """
+    if starting_values is None:
+        starting_values = {}
+    threshold_values = {name: starting_values.get(name, starting_value)
+                        for name, starting_value in THRESHOLD_PARAMETERS.items()}
+    tau1 = Beta('tau1', min(threshold_values['tau1'], tau1_upper_bound), None, tau1_upper_bound, 0)
+    delta2 = Beta('delta2', max(threshold_values['delta2'], 0), 0, None, 0)
+    tau2 = tau1 + delta2
+    delta3 = Beta('delta3', max(threshold_values['delta3'], 0), 0, None, 0)
+    tau3 = tau2 + delta3
+    delta4 = Beta('delta4', max(threshold_values['delta4'], 0), 0, None, 0)
+    tau4 = tau3 + delta4
+    # Associate each discrete indicator with an interval.
+    #   0: -infinity -> tau1
+    #   1: tau1 -> tau2
+    #   2: tau2 -> tau3
+    #   ...
+    #   4+: tau4 -> +infinity
+    return {0: 1 - dist.logisticcdf(utility - tau1),
+            1: dist.logisticcdf(utility - tau1) - dist.logisticcdf(utility - tau2),
+            2: dist.logisticcdf(utility - tau2) - dist.logisticcdf(utility - tau3),
+            3: dist.logisticcdf(utility - tau3) - dist.logisticcdf(utility - tau4),
+            4: dist.logisticcdf(utility - tau4)}
@@ -0,0 +1,51 @@
+""" Compression of identical rows: persons with the same features (and the same number of trips, for the estimation)
+have the same contribution to the log likelihood and the same probabilities. The estimation and the simulation with
+Biogeme can therefore run on one row per pattern of values, with the number (or the sum of the weights) of its rows as
+weight, and the results of the simulation are expanded back to the rows afterwards. The simulation with NumPy (see
+ordered_logit) does not compress the rows: finding the patterns (a sort of the rows) takes longer than computing the
+probabilities of all rows.
+"""
+import numpy as np
+import pandas as pd
+
+
+def compress_rows(matrix, weights=None):
+    """ Identical rows of a matrix
+    :param matrix: Array with one row per observation, e.g., the design matrix with the choices as last column
+    :param weights: Weight of each row (None: 1)
+    :return: A dictionary with 'rows' (position of the first row of each pattern), 'inverse' (pattern of each row, so
+    that values of the patterns are expanded with values[inverse]), 'counts' (number of rows of each pattern) and
+    'weights' (sum of the weights of the rows of each pattern)
+    """
+    ''' Rows as strings of bytes, so that the patterns are found with one sort (-0.0 is replaced by 0.0) '''
+    matrix = np.ascontiguousarray(np.asarray(matrix, dtype=float) + 0.0)
+    if matrix.ndim == 1:
+        matrix = matrix[:, np.newaxis]
+    rows = matrix.view(np.dtype((np.void, matrix.dtype.itemsize * matrix.shape[1]))).ravel()
+    _, first_rows, inverse, counts = np.unique(rows, return_index=True, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    if weights is None:
+        sums_of_weights = counts.astype(float)
+    else:
+        sums_of_weights = np.bincount(inverse, weights=np.asarray(weights, dtype=float), minlength=len(counts))
+    return {'rows': first_rows, 'inverse': inverse, 'counts': counts, 'weights': sums_of_weights}
+
+
+def compress_dataframe(df, weight_column='weight'):
+    """ One row per pattern of values of the columns of df, with the number of its rows in weight_column
+    :return: The compressed dataframe and the pattern of each row of df (see compress_rows)
+    """
+    compressed_rows = compress_rows(df.to_numpy(dtype=float))
+    df_compressed = df.iloc[compressed_rows['rows']].reset_index(drop=True)
+    df_compressed[weight_column] = compressed_rows['counts'].astype(float)
+    return df_compressed, compressed_rows['inverse']
+
+
+def expand_dataframe(df_compressed, inverse, index):
+    """ Results of the patterns (one row per pattern, in the order of compress_dataframe) for each row
+    :param index: Index of the rows
+    """
+    df_expanded = df_compressed.iloc[inverse]
+    df_expanded.index = pd.Index(index)
+    return df_expanded
+
@@ -0,0 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_concurrently(list_of_runs, nb_of_threads=None):
+    """ Run several estimations or simulations at the same time, in threads of the current process, e.g.,
+    run_concurrently([(run_estimation_home_work, {'data_file_directory': ..., 'data_file_name': ...,
+                                                  'output_directory': ...}),
+                      (apply_home_work_model_to_microcensus, {...})])
+    The entry points of the models (run_estimation_home_work, apply_home_work_model_to_microcensus) do not change the
+    working directory and do not define global variables, so that they can run at the same time, as long as each run
+    has its own output directory (or its own output file names).
+    :param list_of_runs: List of pairs (function, dictionary of keyword arguments)
+    :param nb_of_threads: Number of runs at the same time (None: default of ThreadPoolExecutor)
+    :return: The list of the results of the runs, in the order of list_of_runs. If a run fails, its exception is
+    raised once all runs are finished.
+    """
+    with ThreadPoolExecutor(max_workers=nb_of_threads) as executor:
+        futures = [executor.submit(function, **arguments) for function, arguments in list_of_runs]
+    return [future.result() for future in futures]
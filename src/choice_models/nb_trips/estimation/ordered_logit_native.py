@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize, Bounds
+from scipy.stats import norm
+from choice_models.nb_trips.home_work_specification import THRESHOLD_PARAMETERS, TAU1_UPPER_BOUND
+
+''' Thresholds tau = A @ (tau1, delta2, delta3, delta4) '''
+THRESHOLDS_FROM_PARAMETERS = np.tril(np.ones((4, 4)))
+SMALLEST_PROBABILITY = 1e-300
+
+
+def get_log_likelihood_derivatives(parameters, design_matrix, choices, weights):
+    """ Log likelihood of the ordered logit, with its gradient, its Hessian and the gradient of each observation.
+    The probability of choice y is P = F(U - tau_y) - F(U - tau_(y+1)) (with F(U - tau_0) = 1 and F(U - tau_5) = 0),
+    where U is the linear utility and F the logistic CDF. Derivatives are first computed with respect to U and the four
+    thresholds, then with respect to the betas and (tau1, delta2, delta3, delta4), which are linear functions of them.
+    """
+    nb_of_observations, nb_of_betas = design_matrix.shape
+    betas = parameters[:nb_of_betas]
+    thresholds = THRESHOLDS_FROM_PARAMETERS @ parameters[nb_of_betas:]
+    utilities = design_matrix @ betas
+    cdf = np.exp(-np.logaddexp(0.0, -(utilities[:, np.newaxis] - thresholds[np.newaxis, :])))
+    pdf = cdf * (1.0 - cdf)
+    pdf_derivative = pdf * (1.0 - 2.0 * cdf)
+    rows = np.arange(nb_of_observations)
+    has_upper = choices > 0  # F(U - tau_y) is not the constant 1
+    has_lower = choices < 4  # F(U - tau_(y+1)) is not the constant 0
+    upper_index = np.maximum(choices - 1, 0)
+    lower_index = np.minimum(choices, 3)
+    cdf_upper = np.where(has_upper, cdf[rows, upper_index], 1.0)
+    cdf_lower = np.where(has_lower, cdf[rows, lower_index], 0.0)
+    pdf_upper = np.where(has_upper, pdf[rows, upper_index], 0.0)
+    pdf_lower = np.where(has_lower, pdf[rows, lower_index], 0.0)
+    pdf_derivative_upper = np.where(has_upper, pdf_derivative[rows, upper_index], 0.0)
+    pdf_derivative_lower = np.where(has_lower, pdf_derivative[rows, lower_index], 0.0)
+    probabilities = np.maximum(cdf_upper - cdf_lower, SMALLEST_PROBABILITY)
+    log_likelihood = np.sum(weights * np.log(probabilities))
+    ''' First derivatives of log(P) with respect to U and to the thresholds '''
+    d_utility = (pdf_upper - pdf_lower) / probabilities
+    d_thresholds = np.zeros((nb_of_observations, 4))
+    d_thresholds[rows[has_upper], upper_index[has_upper]] -= pdf_upper[has_upper] / probabilities[has_upper]
+    d_thresholds[rows[has_lower], lower_index[has_lower]] += pdf_lower[has_lower] / probabilities[has_lower]
+    ''' Second derivatives of P divided by P '''
+    d2_utility = (pdf_derivative_upper - pdf_derivative_lower) / probabilities - d_utility ** 2
+    d2_utility_thresholds = np.zeros((nb_of_observations, 4))
+    d2_utility_thresholds[rows[has_upper], upper_index[has_upper]] -= \
+        pdf_derivative_upper[has_upper] / probabilities[has_upper]
+    d2_utility_thresholds[rows[has_lower], lower_index[has_lower]] += \
+        pdf_derivative_lower[has_lower] / probabilities[has_lower]
+    d2_utility_thresholds -= d_utility[:, np.newaxis] * d_thresholds
+    d2_thresholds_diagonal = np.zeros((nb_of_observations, 4))
+    d2_thresholds_diagonal[rows[has_upper], upper_index[has_upper]] += \
+        pdf_derivative_upper[has_upper] / probabilities[has_upper]
+    d2_thresholds_diagonal[rows[has_lower], lower_index[has_lower]] -= \
+        pdf_derivative_lower[has_lower] / probabilities[has_lower]
+    ''' Chain rule to the parameters '''
+    gradient_per_observation = np.hstack([design_matrix * d_utility[:, np.newaxis],
+                                          d_thresholds @ THRESHOLDS_FROM_PARAMETERS])
+    gradient = weights @ gradient_per_observation
+    hessian_betas = design_matrix.T @ (design_matrix * (weights * d2_utility)[:, np.newaxis])
+    hessian_betas_thresholds = design_matrix.T @ (d2_utility_thresholds * weights[:, np.newaxis]) @ \
+        THRESHOLDS_FROM_PARAMETERS
+    hessian_thresholds = np.diag(weights @ d2_thresholds_diagonal) - \
+        d_thresholds.T @ (d_thresholds * weights[:, np.newaxis])
+    hessian_thresholds = THRESHOLDS_FROM_PARAMETERS.T @ hessian_thresholds @ THRESHOLDS_FROM_PARAMETERS
+    hessian = np.block([[hessian_betas, hessian_betas_thresholds],
+                        [hessian_betas_thresholds.T, hessian_thresholds]])
+    return log_likelihood, gradient, hessian, gradient_per_observation
+
+
+def estimate_ordered_logit(design_matrix, choices, beta_names, weights=None, starting_values=None):
+    """ Maximum likelihood estimation of the ordered logit of the number of trips (0, 1, 2, 3, 4+), with the analytic
+    gradient and Hessian (trust region Newton method of scipy). As in the Biogeme model, the thresholds are
+    parametrized with tau1 (lower than TAU1_UPPER_BOUND) and positive deltas: tau_k = tau_(k-1) + delta_k.
+    :param design_matrix: Array with one row per observation and one column per beta (see get_design_matrix)
+    :param choices: Array with the number of trips (0 to 4) of each observation
+    :param beta_names: Names of the columns of the design matrix
+    :param weights: Weight of each observation in the log likelihood (None: 1 for all observations)
+    :param starting_values: Dictionary of starting values (default: 0 for the betas and the values of
+    THRESHOLD_PARAMETERS)
+    :return: A dictionary with 'betas' (name: value), 'estimated parameters' (dataframe with the same columns as
+    getEstimatedParameters() of Biogeme), 'covariance', 'robust covariance', 'log likelihood' and 'nb of iterations'
+    """
+    if weights is None:
+        weights = np.ones(len(choices))
+    if starting_values is None:
+        starting_values = {}
+    choices = np.asarray(choices).astype(np.int64)
+    weights = np.asarray(weights, dtype=float)
+    parameter_names = list(beta_names) + list(THRESHOLD_PARAMETERS)
+    initial_parameters = np.array([starting_values.get(name, THRESHOLD_PARAMETERS.get(name, 0.0))
+                                   for name in parameter_names])
+    lower_bounds = np.array([-np.inf] * (len(beta_names) + 1) + [0.0] * 3)
+    upper_bounds = np.array([np.inf] * len(beta_names) + [TAU1_UPPER_BOUND] + [np.inf] * 3)
+    initial_parameters = np.clip(initial_parameters, lower_bounds, upper_bounds)
+
+    last_evaluation = {}
+
+    def evaluate(parameters):
+        ''' The log likelihood and its derivatives are computed together, once per point '''
+        if last_evaluation.get('parameters') is None or not np.array_equal(last_evaluation['parameters'], parameters):
+            last_evaluation['parameters'] = np.array(parameters)
+            last_evaluation['derivatives'] = get_log_likelihood_derivatives(parameters, design_matrix, choices,
+                                                                            weights)
+        return last_evaluation['derivatives']
+
+    def negative_log_likelihood(parameters):
+        return -evaluate(parameters)[0]
+
+    def negative_gradient(parameters):
+        return -evaluate(parameters)[1]
+
+    def negative_hessian(parameters):
+        return -evaluate(parameters)[2]
+
+    optimization_results = minimize(negative_log_likelihood, initial_parameters, method='trust-constr',
+                                    jac=negative_gradient, hess=negative_hessian,
+                                    bounds=Bounds(lower_bounds, upper_bounds))
+    parameters = optimization_results.x
+    log_likelihood, gradient, hessian, gradient_per_observation = \
+        get_log_likelihood_derivatives(parameters, design_matrix, choices, weights)
+    covariance = np.linalg.pinv(-hessian)
+    ''' Sandwich estimator (BHHH matrix between two inverses of the Hessian), as the robust errors of Biogeme '''
+    bhhh = gradient_per_observation.T @ (gradient_per_observation * weights[:, np.newaxis])
+    robust_covariance = covariance @ bhhh @ covariance
+    return {'betas': dict(zip(parameter_names, parameters)),
+            'estimated parameters': get_estimated_parameters(parameter_names, parameters, covariance,
+                                                             robust_covariance),
+            'covariance': pd.DataFrame(covariance, index=parameter_names, columns=parameter_names),
+            'robust covariance': pd.DataFrame(robust_covariance, index=parameter_names, columns=parameter_names),
+            'log likelihood': log_likelihood,
+            'nb of iterations': optimization_results.nit}
+
+
+def get_estimated_parameters(parameter_names, parameters, covariance, robust_covariance):
+    standard_errors = np.sqrt(np.maximum(np.diag(covariance), 0.0))
+    robust_standard_errors = np.sqrt(np.maximum(np.diag(robust_covariance), 0.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_tests = parameters / standard_errors
+        robust_t_tests = parameters / robust_standard_errors
+    return pd.DataFrame({'Value': parameters,
+                         'Std err': standard_errors,
+                         't-test': t_tests,
+                         'p-value': 2.0 * norm.sf(np.abs(t_tests)),
+                         'Rob. Std err': robust_standard_errors,
+                         'Rob. t-test': robust_t_tests,
+                         'Rob. p-value': 2.0 * norm.sf(np.abs(robust_t_tests))},
+                        index=parameter_names).sort_index()
@@ -0,0 +1,255 @@
+""" Forecasts of the number of trips from home to work for many scenarios at once (e.g., 2015 to 2030).
+
+The design matrix of the base population (MTMC or synthetic population) is computed once. A scenario changes the
+betas (including the thresholds), some attributes of the persons (the columns of the features that depend on them are
+computed again), the value of some features, the share of persons with a binary feature (e.g., the share of persons
+working from home) or the weights of the persons (e.g., a projection of the population). The
+utilities of all scenarios are computed together, as one matrix product per block of persons, and only the aggregates
+(weighted shares of the alternatives and expected number of trips) are kept.
+
+A scenario is a dictionary with:
+- 'name': name of the scenario,
+- 'betas': values of some betas, replacing the estimated ones (optional),
+- 'attributes': values of some columns of the data, a number or an array with one value per person (optional),
+  e.g., {'age': ages_in_2030, 'car_avail': 3}. All the features of the specification are computed again from the
+  changed columns, e.g., the piecewise terms of the age or home_work_distance_car and home_work_distance_no_car,
+- 'features': values of some features of the specification that are not columns of the data, a number or an array
+  with one value per person (optional), e.g., {'working_from_home': 0}. Only the column of the design matrix of the
+  feature changes: columns of the data must be changed with 'attributes',
+- 'shares': share of persons for which some binary features of the specification are 1 (optional), e.g.,
+  {'working_from_home': 0.3}. Each person has the feature with this probability, independently of the other
+  features: the probabilities of the person are the mix of the probabilities with and without the feature,
+- 'weights': weight of each person (optional, default: the weights of the base population).
+"""
+import itertools
+import numpy as np
+import pandas as pd
+from choice_models.nb_trips.home_work_specification import get_design_matrix, get_beta_vector, get_thresholds, \
+    get_free_terms
+from choice_models.nb_trips.ordered_logit import ALTERNATIVES, logistic_cdf
+
+
+def get_base_population(df, specification, weights='WP', groupby=None):
+    """ Design matrix and weights of the base population, computed once for all scenarios. Children 14 years old and
+    younger are not simulated: we assume that they do 0 trips to work.
+    :param df: Data with the columns of nb_trips.csv and the business sectors, one row per person
+    :param specification: Specification the betas of the scenarios were estimated with (see model_artifact.get_model)
+    :param weights: Column with the weights of the persons (None: 1 for all persons)
+    :param groupby: Column or list of columns splitting the results in groups, e.g., 'region' (None: no groups)
+    :return: A dictionary with the data, the names of the betas, the design matrix of the adults, the weights, the
+    positions of the adults and the children, and the group of each person
+    """
+    is_adult = df['age'].to_numpy() > 14
+    beta_names, design_matrix = get_design_matrix(df[is_adult], specification)
+    if weights is None:
+        weight_values = np.ones(len(df))
+    else:
+        weight_values = df[weights].to_numpy(dtype=float)
+    if groupby is None:
+        group_codes = np.zeros(len(df), dtype=np.int64)
+        df_groups = pd.DataFrame(index=[0])
+    else:
+        if isinstance(groupby, str):
+            groupby = [groupby]
+        group_codes, df_groups = pd.MultiIndex.from_frame(df[groupby]).factorize(sort=True)
+        df_groups = df_groups.to_frame(index=False)
+        df_groups.columns = groupby
+    return {'specification': specification,
+            'data': df,
+            'beta names': beta_names,
+            'design matrix': design_matrix,
+            'weights': weight_values,
+            'adults': np.flatnonzero(is_adult),
+            'children': np.flatnonzero(~is_adult),
+            'group codes': group_codes,
+            'groups': df_groups}
+
+
+def forecast_scenarios(base_population, betas, scenarios, block_size=100000):
+    """ Weighted shares of 0, 1, 2, 3 and 4+ trips from home to work and expected number of trips, in each scenario
+    and group of the base population. The persons are processed in blocks of block_size rows, so that the memory used
+    does not depend on the size of the population.
+    :param base_population: Result of get_base_population
+    :param betas: Dictionary with the betas estimated with the specification of the base population (e.g., 'betas'
+    of model_artifact.get_model)
+    :param scenarios: List of scenarios (see the description of the module)
+    :return: A tidy dataframe with one row per scenario and group, and the columns 'scenario', the columns of groupby,
+    'sum of weights', one column per alternative (weighted share), 'expected nb of trips' (weighted average) and
+    'nb of trips' (weighted sum)
+    """
+    beta_names = base_population['beta names']
+    design_matrix = base_population['design matrix']
+    adults = base_population['adults']
+    children = base_population['children']
+    group_codes = base_population['group codes']
+    nb_of_groups = len(base_population['groups'])
+    nb_of_scenarios = len(scenarios)
+    scenario_betas = [{**betas, **scenario.get('betas', {})} for scenario in scenarios]
+    beta_matrix = np.column_stack([get_beta_vector(betas_of_scenario, beta_names)
+                                   for betas_of_scenario in scenario_betas])
+    thresholds = np.vstack([get_thresholds(betas_of_scenario) for betas_of_scenario in scenario_betas])
+    weights = np.column_stack([np.asarray(scenario.get('weights', base_population['weights']), dtype=float)
+                               for scenario in scenarios])
+    attribute_values = [get_attribute_values(scenario.get('attributes', {}), base_population)
+                        for scenario in scenarios]
+    feature_values = [get_feature_values(scenario.get('features', {}), base_population) for scenario in scenarios]
+    feature_shares = [get_feature_shares(scenario.get('shares', {}), base_population) for scenario in scenarios]
+    for scenario, values, shares in zip(scenarios, feature_values, feature_shares):
+        if set(values) & set(shares):
+            raise Exception('Features of the scenario ' + str(scenario.get('name')) + ' not well defined: a feature '
+                            'has a value and a share')
+    ''' Weighted sums of the probabilities of each group, scenario and alternative '''
+    weighted_sums = np.zeros((nb_of_groups, nb_of_scenarios, len(ALTERNATIVES)))
+    for start in range(0, len(adults), block_size):
+        rows = slice(start, start + block_size)
+        feature_values_of_block = []
+        for scenario, attributes, values_of_scenario, shares in zip(scenarios, attribute_values, feature_values,
+                                                                    feature_shares):
+            ''' Features computed again from the changed attributes, then the values of the features '''
+            values_of_block = get_features_of_attributes(attributes, base_population, rows)
+            values_of_block.update({column: values[rows] if np.ndim(values) else values
+                                    for column, values in values_of_scenario.items()})
+            if set(values_of_block) & set(shares):
+                raise Exception('Features of the scenario ' + str(scenario.get('name')) + ' not well defined: a '
+                                'feature with a share depends on a changed attribute')
+            feature_values_of_block.append(values_of_block)
+        probabilities = get_probabilities_of_scenarios(design_matrix[rows], beta_matrix, thresholds,
+                                                       feature_values_of_block, feature_shares)
+        weighted_probabilities = weights[adults[rows]][:, :, np.newaxis] * probabilities
+        group_matrix = get_group_matrix(group_codes[adults[rows]], nb_of_groups)
+        weighted_sums += (group_matrix.T @ weighted_probabilities.reshape(len(probabilities), -1)).reshape(
+            weighted_sums.shape)
+    ''' Children: 0 trips '''
+    weighted_sums[:, :, ALTERNATIVES.index(0)] += get_group_matrix(group_codes[children], nb_of_groups).T @ \
+        weights[children]
+    return get_results(weighted_sums, scenarios, base_population['groups'])
+
+
+def get_probabilities_of_scenarios(design_matrix, beta_matrix, thresholds, feature_values, feature_shares):
+    """ Probabilities of the alternatives of a block of persons in all scenarios
+    :param design_matrix: Array with one row per person and one column per beta
+    :param beta_matrix: Array with one row per beta and one column per scenario
+    :param thresholds: Array with one row per scenario and the four thresholds
+    :param feature_values: For each scenario, a dictionary with the column of the design matrix and the new values
+    :param feature_shares: For each scenario, a dictionary with the column of the design matrix and the share
+    :return: An array with one row per person, one column per scenario and the alternatives in the third dimension
+    """
+    utilities = design_matrix @ beta_matrix
+    for scenario_index, values_of_scenario in enumerate(feature_values):
+        for column, values in values_of_scenario.items():
+            utilities[:, scenario_index] += (values - design_matrix[:, column]) * beta_matrix[column, scenario_index]
+    probabilities = get_probabilities_from_utilities(utilities, thresholds)
+    for scenario_index, shares_of_scenario in enumerate(feature_shares):
+        if not shares_of_scenario:
+            continue
+        columns = list(shares_of_scenario)
+        betas_of_features = beta_matrix[columns, scenario_index]
+        utilities_without_features = utilities[:, scenario_index] - design_matrix[:, columns] @ betas_of_features
+        probabilities[:, scenario_index] = 0.0
+        ''' Mix of the probabilities of all combinations of the binary features '''
+        for combination in itertools.product([0.0, 1.0], repeat=len(columns)):
+            combination = np.array(combination)
+            probability_of_combination = np.prod([share if has_feature else 1.0 - share
+                                                  for share, has_feature
+                                                  in zip(shares_of_scenario.values(), combination)])
+            if probability_of_combination == 0.0:
+                continue
+            probabilities[:, scenario_index] += probability_of_combination * get_probabilities_from_utilities(
+                (utilities_without_features + combination @ betas_of_features)[:, np.newaxis],
+                thresholds[[scenario_index]])[:, 0]
+    return probabilities
+
+
+def get_probabilities_from_utilities(utilities, thresholds):
+    """ Probabilities of the ordered logit (see ordered_logit.get_probabilities) for several scenarios
+    :param utilities: Array with one row per person and one column per scenario
+    :param thresholds: Array with one row per scenario and the four thresholds
+    :return: An array with one row per person, one column per scenario and the alternatives in the third dimension
+    """
+    cumulative_probabilities = logistic_cdf(utilities[:, :, np.newaxis] - thresholds[np.newaxis, :, :])
+    ones = np.ones(utilities.shape + (1,))
+    zeros = np.zeros(utilities.shape + (1,))
+    return np.concatenate([ones, cumulative_probabilities], axis=2) - \
+        np.concatenate([cumulative_probabilities, zeros], axis=2)
+
+
+def get_attribute_values(values_of_attributes, base_population):
+    """ Values of the changed columns of the data of a scenario for the adults """
+    attribute_values = {}
+    for attribute_name, values in values_of_attributes.items():
+        if attribute_name not in base_population['data']:
+            raise Exception('Attribute ' + attribute_name + ' not well defined: not a column of the data')
+        attribute_values[attribute_name] = np.asarray(values)[base_population['adults']] if np.ndim(values) \
+            else values
+    return attribute_values
+
+
+def get_features_of_attributes(attribute_values, base_population, rows):
+    """ Columns of the design matrix that change with the attributes of a scenario, for a block of adults
+    :param attribute_values: Result of get_attribute_values
+    :param rows: Slice of the adults of the block
+    :return: A dictionary with the column of the design matrix and the new values of the block
+    """
+    if not attribute_values:
+        return {}
+    df_block = base_population['data'].iloc[base_population['adults'][rows]].copy()
+    for attribute_name, values in attribute_values.items():
+        df_block[attribute_name] = values[rows] if np.ndim(values) else values
+    design_matrix_of_block = get_design_matrix(df_block, base_population['specification'])[1]
+    changed_columns = np.flatnonzero((design_matrix_of_block != base_population['design matrix'][rows]).any(axis=0))
+    return {column: design_matrix_of_block[:, column] for column in changed_columns}
+
+
+def get_feature_values(values_of_features, base_population):
+    """ Column of the design matrix of each feature of a scenario and its values for the adults """
+    for feature_name in values_of_features:
+        if feature_name in base_population['data']:
+            raise Exception('Feature ' + feature_name + ' not well defined: it is a column of the data, other '
+                            'features may depend on it (change it with the attributes of the scenario)')
+    return {get_column_of_feature(feature_name, base_population):
+            np.asarray(values, dtype=float)[base_population['adults']] if np.ndim(values) else float(values)
+            for feature_name, values in values_of_features.items()}
+
+
+def get_feature_shares(shares_of_features, base_population):
+    feature_shares = {}
+    for feature_name, share in shares_of_features.items():
+        if not 0.0 <= share <= 1.0:
+            raise Exception('Share of ' + feature_name + ' not well defined: ' + str(share))
+        feature_shares[get_column_of_feature(feature_name, base_population)] = float(share)
+    return feature_shares
+
+
+def get_column_of_feature(feature_name, base_population):
+    """ Column of the design matrix of a feature (or of a beta) of the specification """
+    beta_names = base_population['beta names']
+    for beta_name, feature_of_beta in get_free_terms(base_population['specification']):
+        if feature_name in [feature_of_beta, beta_name]:
+            return beta_names.index(beta_name)
+    raise Exception('Feature ' + feature_name + ' not well defined: not in the specification')
+
+
+def get_group_matrix(group_codes, nb_of_groups):
+    """ Matrix with one row per person and one column per group, equal to 1 if the person is in the group. Persons with
+    a missing value of groupby (code -1) are in no group. """
+    group_matrix = np.zeros((len(group_codes), nb_of_groups))
+    has_group = group_codes >= 0
+    group_matrix[np.flatnonzero(has_group), group_codes[has_group]] = 1.0
+    return group_matrix
+
+
+def get_results(weighted_sums, scenarios, df_groups):
+    sum_of_weights = weighted_sums.sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = weighted_sums / sum_of_weights[:, :, np.newaxis]
+    list_of_results = []
+    for scenario_index, scenario in enumerate(scenarios):
+        df_results = df_groups.copy()
+        df_results.insert(0, 'scenario', scenario.get('name', scenario_index))
+        df_results['sum of weights'] = sum_of_weights[:, scenario_index]
+        for alternative_index, alternative in enumerate(ALTERNATIVES):
+            df_results[alternative] = shares[:, scenario_index, alternative_index]
+        df_results['expected nb of trips'] = shares[:, scenario_index, :] @ np.array(ALTERNATIVES, dtype=float)
+        df_results['nb of trips'] = weighted_sums[:, scenario_index, :] @ np.array(ALTERNATIVES, dtype=float)
+        list_of_results.append(df_results)
+    return pd.concat(list_of_results, ignore_index=True)
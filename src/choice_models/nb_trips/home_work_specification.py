@@ -0,0 +1,329 @@
+""" Specification of the ordered logit of the number of trips from home to work, as arrays.
+
+A specification is a list of terms (name of the beta, name of the feature), or (name of the beta, name of the
+feature, status) where status 1 means that the beta is fixed at zero, as the last argument of Beta in Biogeme. The
+utility is the sum of the betas times their feature. The features are computed with NumPy from the columns of the
+data file nb_trips.csv (see FEATURES); names that are not in FEATURES are columns of the data. The names of the
+betas are the ones used by Biogeme, including the betas of models.piecewiseFormula, so that the betas of an
+estimation can be used with this specification.
+"""
+import numpy as np
+
+NATIONALITIES_NORTHWESTERN_EUROPE = [8204,  # Belgium
+                                     8223,  # Luxembourg
+                                     8227,  # Netherlands
+                                     8206,  # Denmark
+                                     8211,  # Finland
+                                     8215,  # United Kingdom
+                                     8216,  # Ireland
+                                     8217,  # Iceland
+                                     8228,  # Norway
+                                     8234]  # Sweden
+NATIONALITIES_SOUTH_WEST_EUROPE = [8231,  # Portugal
+                                   8236,  # Spain
+                                   8202]  # Andorra
+NATIONALITIES_SOUTHEAST_EUROPE = [8224,  # Malta
+                                  8201,  # Albania
+                                  8214,  # Greece
+                                  8256,  # Kosovo
+                                  8250,  # Croatia
+                                  8251,  # Slovenia
+                                  8252,  # Bosnia and Herzegovina
+                                  8255,  # Macedonia
+                                  8205,  # Bulgaria
+                                  8239,  # Turkey
+                                  8242,  # Cyprus
+                                  8248,  # Serbia
+                                  8254]  # Montenegro
+NATIONALITIES_EASTERN_EUROPE = [8230,  # Poland
+                                8232,  # Rumania
+                                8240,  # Hungary
+                                8243,  # Slovakia
+                                8244,  # Czech Republic
+                                8263,  # Moldavia
+                                8265,  # Ukraine
+                                8266,  # Belarus
+                                8260,  # Estonia
+                                8261,  # Latvia
+                                8262]  # Lithuania
+
+
+def column(df, name):
+    return df[name].to_numpy(dtype=float)
+
+
+def is_in(df, name, values):
+    return np.isin(column(df, name), values).astype(float)
+
+
+def get_work_percentage_uncapped(df):
+    percentage_first_part_time_job = column(df, 'percentage_first_part_time_job')
+    return (column(df, 'full_part_time_job') == 1) * 100.0 + \
+        percentage_first_part_time_job * (percentage_first_part_time_job > 0)
+
+
+def get_work_percentage(df):
+    return np.minimum(get_work_percentage_uncapped(df), 100.0)
+
+
+def get_working_from_home(df):
+    return (is_in(df, 'home_office', [1, 2]) * (column(df, 'percentage_home_office') > 0)).astype(float)
+
+
+def get_home_work_distance(df):
+    home_work_crow_fly_distance = column(df, 'home_work_crow_fly_distance')
+    return home_work_crow_fly_distance * (home_work_crow_fly_distance >= 0.0) / 100000.0
+
+
+def get_car_avail(df):
+    return is_in(df, 'car_avail', [1, 2])
+
+
+FEATURES = {'car_avail_syn_pop': get_car_avail,
+            'car_avail_NA': lambda df: (column(df, 'car_avail') < 0).astype(float),
+            'with_general_abo_employees':
+                lambda df: is_in(df, 'GA_ticket', [1]) * is_in(df, 'work_position', [2]),
+            'with_verbund_abo': lambda df: is_in(df, 'Verbund_Abo', [1]),
+            'urban': lambda df: is_in(df, 'city_typology', [1]),
+            'rural': lambda df: is_in(df, 'city_typology', [3]),
+            'intermediate': lambda df: is_in(df, 'city_typology', [2]),
+            'single_household': lambda df: is_in(df, 'hh_type', [10]),
+            'couple_without_children': lambda df: is_in(df, 'hh_type', [210]),
+            'couple_without_children_30': lambda df: is_in(df, 'hh_type', [210]) * (column(df, 'age') <= 30),
+            'couple_with_children': lambda df: is_in(df, 'hh_type', [220]),
+            'single_parent_with_children': lambda df: is_in(df, 'hh_type', [230]),
+            'executives': lambda df: is_in(df, 'work_position', [1]),
+            'employees': lambda df: is_in(df, 'work_position', [2]),
+            'studying': lambda df: is_in(df, 'ERWERB', [3]),
+            'inactive': lambda df: is_in(df, 'ERWERB', [4]),
+            'active_without_known_work_percentage': lambda df: is_in(df, 'ERWERB', [9]),
+            'public_transport_connection_quality_ARE_A':
+                lambda df: is_in(df, 'public_transport_connection_quality_ARE', [1]),
+            'public_transport_connection_quality_ARE_B':
+                lambda df: is_in(df, 'public_transport_connection_quality_ARE', [2]),
+            'public_transport_connection_quality_ARE_C':
+                lambda df: is_in(df, 'public_transport_connection_quality_ARE', [3]),
+            'public_transport_connection_quality_ARE_D':
+                lambda df: is_in(df, 'public_transport_connection_quality_ARE', [4]),
+            'public_transport_connection_quality_ARE_NA':
+                lambda df: is_in(df, 'public_transport_connection_quality_ARE', [5]),
+            'public_transport_connection_quality_ARE_NA_car':
+                lambda df: is_in(df, 'public_transport_connection_quality_ARE', [5]) * get_car_avail(df),
+            'public_transport_connection_quality_ARE_NA_no_car':
+                lambda df: is_in(df, 'public_transport_connection_quality_ARE', [5]) * (1 - get_car_avail(df)),
+            'hh_income_na': lambda df: is_in(df, 'hh_income', [-98]),
+            'hh_income_less_than_2000': lambda df: is_in(df, 'hh_income', [1]),
+            'hh_income_2000_to_4000': lambda df: is_in(df, 'hh_income', [2]),
+            'hh_income_4001_to_6000': lambda df: is_in(df, 'hh_income', [3]),
+            'hh_income_6001_to_8000': lambda df: is_in(df, 'hh_income', [4]),
+            'hh_income_8001_to_10000': lambda df: is_in(df, 'hh_income', [5]),
+            'hh_income_10001_to_12000': lambda df: is_in(df, 'hh_income', [6]),
+            'hh_income_12001_to_14000': lambda df: is_in(df, 'hh_income', [7]),
+            'hh_income_14001_to_16000': lambda df: is_in(df, 'hh_income', [8]),
+            'hh_income_more_than_16000': lambda df: is_in(df, 'hh_income', [9]),
+            'no_post_school_educ': lambda df: is_in(df, 'highest_educ', [1, 2, 3, 4]),
+            'secondary_education': lambda df: is_in(df, 'highest_educ', [5, 6, 7, 8, 9, 10, 11, 12]),
+            'tertiary_education': lambda df: is_in(df, 'highest_educ', [13, 14, 15, 16]),
+            'tertiary_education_employees':
+                lambda df: is_in(df, 'work_position', [2]) * is_in(df, 'highest_educ', [13, 14, 15, 16]),
+            'university': lambda df: is_in(df, 'highest_educ', [17]),
+            'region_lake_geneva': lambda df: is_in(df, 'region', [1]),
+            'region_espace_mittelland': lambda df: is_in(df, 'region', [2]),
+            'region_northern_switzerland': lambda df: is_in(df, 'region', [3]),
+            'region_zurich': lambda df: is_in(df, 'region', [4]),
+            'region_eastern_switzerland': lambda df: is_in(df, 'region', [5]),
+            'region_central_switzerland': lambda df: is_in(df, 'region', [6]),
+            'region_tessin': lambda df: is_in(df, 'region', [7]),
+            'male_employees': lambda df: is_in(df, 'sex', [1]) * is_in(df, 'work_position', [2]),
+            'working_from_home': get_working_from_home,
+            'working_from_home_na': lambda df: is_in(df, 'home_office', [-99]),
+            'percentage_if_home_office':
+                lambda df: is_in(df, 'home_office', [1, 2]) * column(df, 'percentage_home_office'),
+            'french': lambda df: is_in(df, 'language', [2]),
+            'italian_employees': lambda df: is_in(df, 'language', [3]) * is_in(df, 'work_position', [2]),
+            'work_percentage': get_work_percentage,
+            'work_percentage_uncapped': get_work_percentage_uncapped,
+            'home_work_distance': get_home_work_distance,
+            'home_work_distance_car': lambda df: get_car_avail(df) * get_home_work_distance(df),
+            'home_work_distance_no_car': lambda df: (1 - get_car_avail(df)) * get_home_work_distance(df),
+            'nb_car_in_hh_clean': lambda df: column(df, 'nb_car_in_hh') * (column(df, 'nb_car_in_hh') > 0),
+            'nationality_switzerland': lambda df: is_in(df, 'nation', [8100]),
+            'nationality_germany_austria_lichtenstein': lambda df: is_in(df, 'nation', [8207, 8229, 8222]),
+            'nationality_italy_vatican': lambda df: is_in(df, 'nation', [8218, 8241]),
+            'nationality_france_monaco_san_marino': lambda df: is_in(df, 'nation', [8212, 8226, 8233]),
+            'nationality_northwestern_europe': lambda df: is_in(df, 'nation', NATIONALITIES_NORTHWESTERN_EUROPE),
+            'nationality_south_west_europe': lambda df: is_in(df, 'nation', NATIONALITIES_SOUTH_WEST_EUROPE),
+            'nationality_southeast_europe': lambda df: is_in(df, 'nation', NATIONALITIES_SOUTHEAST_EUROPE),
+            'nationality_eastern_europe': lambda df: is_in(df, 'nation', NATIONALITIES_EASTERN_EUROPE),
+            'nb_between_6_and_15_in_hh':
+                lambda df: column(df, 'nb_less_than_15_in_hh') - column(df, 'nb_less_than_6_in_hh')}
+
+
+def get_feature(df, feature_name):
+    if feature_name in FEATURES:
+        return FEATURES[feature_name](df)
+    return column(df, feature_name)
+
+
+def piecewise_terms(variable_name, thresholds, feature_name=None):
+    """ Terms of models.piecewiseFormula(variable_name, thresholds): one beta per interval, named as in Biogeme
+    (beta_<variable>_<lower threshold>_<upper threshold>). The value of the variable is the feature feature_name
+    (default: variable_name). """
+    if feature_name is None:
+        feature_name = variable_name
+    terms = []
+    for lower_threshold, upper_threshold in zip(thresholds[:-1], thresholds[1:]):
+        piecewise_feature_name = feature_name + '_' + str(lower_threshold) + '_' + str(upper_threshold)
+        FEATURES[piecewise_feature_name] = get_piecewise_feature(feature_name, lower_threshold, upper_threshold)
+        terms.append(('beta_' + variable_name + '_' + str(lower_threshold) + '_' + str(upper_threshold),
+                      piecewise_feature_name))
+    return terms
+
+
+def get_piecewise_feature(feature_name, lower_threshold, upper_threshold):
+    """ Part of the variable in the interval [lower_threshold, upper_threshold], as models.piecewiseVariables """
+    def piecewise_feature(df):
+        return np.maximum(0.0, np.minimum(get_feature(df, feature_name) - lower_threshold,
+                                          upper_threshold - lower_threshold))
+    return piecewise_feature
+
+
+''' Specification used to apply the model (see apply_home_work_model_to_microcensus) '''
+SIMULATION_SPECIFICATION = piecewise_terms('age', [0, 20, 65, 75, 200]) + \
+    [('b_executives', 'executives'),
+     ('b_couple_with_children', 'couple_with_children'),
+     ('b_studying', 'studying'),
+     ('b_public_transport_connection_quality_are_na', 'public_transport_connection_quality_ARE_NA'),
+     ('b_tertiary_education_employees', 'tertiary_education_employees'),
+     ('b_region_eastern_switzerland', 'region_eastern_switzerland'),
+     ('b_french', 'french'),
+     ('b_business_sector_agriculture', 'business_sector_agriculture'),
+     ('b_business_sector_gastronomy', 'business_sector_gastronomy'),
+     ('b_business_sector_production', 'business_sector_production'),
+     ('b_business_sector_wholesale', 'business_sector_wholesale'),
+     ('b_business_sector_non_movers', 'business_sector_non_movers')] + \
+    piecewise_terms('work_percentage', [0, 10, 50, 101], feature_name='work_percentage_uncapped') + \
+    [('b_home_work_distance', 'home_work_distance'),
+     ('b_nationality_nw', 'nationality_northwestern_europe'),
+     ('b_nb_less_than_6_in_hh', 'nb_less_than_6_in_hh'),
+     ('b_working_from_home', 'working_from_home')]
+
+''' Specification of the estimation (see estimation.home_work). Status 1: the beta is fixed at zero '''
+ESTIMATION_SPECIFICATION = [(beta_name, feature_name, 0)
+                            for beta_name, feature_name in piecewise_terms('age', [0, 20, 65, 75, 200])] + \
+    [('b_car_avail', 'car_avail_syn_pop', 1),
+     ('b_car_avail_na', 'car_avail_NA', 1),
+     ('b_ga_employees', 'with_general_abo_employees', 1),
+     ('b_verbund', 'with_verbund_abo', 1),
+     ('b_urban', 'urban', 1),
+     ('b_rural', 'rural', 1),
+     ('b_intermediate', 'intermediate', 1),
+     ('b_single_household', 'single_household', 1),
+     ('b_couple_without_children', 'couple_without_children', 1),
+     ('b_couple_with_children', 'couple_with_children', 0),
+     ('b_single_parent_with_children', 'single_parent_with_children', 1),
+     ('b_employees', 'employees', 1),
+     ('b_executives', 'executives', 1),
+     ('b_studying', 'studying', 0),
+     ('b_inactive', 'inactive', 1),
+     ('b_active_without_known_work_percentage', 'active_without_known_work_percentage', 1),
+     ('b_public_transport_connection_quality_are_a', 'public_transport_connection_quality_ARE_A', 1),
+     ('b_public_transport_connection_quality_are_b', 'public_transport_connection_quality_ARE_B', 1),
+     ('b_public_transport_connection_quality_are_c', 'public_transport_connection_quality_ARE_C', 1),
+     ('b_public_transport_connection_quality_are_d', 'public_transport_connection_quality_ARE_D', 1),
+     ('b_public_transport_connection_quality_are_na_car', 'public_transport_connection_quality_ARE_NA_car', 0),
+     ('b_public_transport_connection_quality_are_na_no_car', 'public_transport_connection_quality_ARE_NA_no_car', 0),
+     ('b_hh_income_less_than_2000', 'hh_income_less_than_2000', 1),
+     ('b_hh_income_2000_to_4000', 'hh_income_2000_to_4000', 1),
+     ('b_hh_income_4001_to_6000', 'hh_income_4001_to_6000', 1),
+     ('b_hh_income_6001_to_8000', 'hh_income_6001_to_8000', 1),
+     ('b_hh_income_8001_to_10000', 'hh_income_8001_to_10000', 1),
+     ('b_hh_income_10001_to_12000', 'hh_income_10001_to_12000', 1),
+     ('b_hh_income_12001_to_14000', 'hh_income_12001_to_14000', 1),
+     ('b_hh_income_14001_to_16000', 'hh_income_14001_to_16000', 1),
+     ('b_hh_income_more_than_16000', 'hh_income_more_than_16000', 1),
+     ('b_no_post_school_education', 'no_post_school_educ', 1),
+     ('b_secondary_education', 'secondary_education', 1),
+     ('b_tertiary_education', 'tertiary_education', 1),
+     ('b_university', 'university', 1),
+     ('b_region_lake_geneva', 'region_lake_geneva', 1),
+     ('b_region_espace_mittelland', 'region_espace_mittelland', 1),
+     ('b_region_northern_switzerland', 'region_northern_switzerland', 1),
+     ('b_region_zurich', 'region_zurich', 1),
+     ('b_region_eastern_switzerland', 'region_eastern_switzerland', 1),
+     ('b_region_central_switzerland', 'region_central_switzerland', 1),
+     ('b_region_tessin', 'region_tessin', 1),
+     ('b_male_employees', 'male_employees', 1),
+     ('b_working_from_home', 'working_from_home', 0),
+     ('b_working_from_home_na', 'working_from_home_na', 1),
+     ('b_percentage_home_office', 'percentage_if_home_office', 0),
+     ('b_french', 'french', 0),
+     ('b_italian_employees', 'italian_employees', 1),
+     ('b_business_sector_agriculture', 'business_sector_agriculture', 0),
+     ('b_business_sector_retail', 'business_sector_retail', 0),
+     ('b_business_sector_gastronomy', 'business_sector_gastronomy', 1),
+     ('b_business_sector_finance', 'business_sector_finance', 0),
+     ('b_business_sector_production', 'business_sector_production', 0),
+     ('b_business_sector_wholesale', 'business_sector_wholesale', 0),
+     ('b_business_sector_services_fc', 'business_sector_services_fc', 0),
+     ('b_business_sector_other_services', 'business_sector_other_services', 1),
+     ('b_business_sector_others', 'business_sector_others', 1),
+     ('b_business_sector_non_movers', 'business_sector_non_movers', 0)] + \
+    [(beta_name, feature_name, 0)
+     for beta_name, feature_name in piecewise_terms('work_percentage', [0, 10, 50, 101])] + \
+    [('b_home_work_distance_car', 'home_work_distance_car', 0),
+     ('b_home_work_distance_no_car', 'home_work_distance_no_car', 0),
+     ('b_nb_car_in_hh', 'nb_car_in_hh_clean', 1),
+     ('b_nationality_ch', 'nationality_switzerland', 1),
+     ('b_nationality_germany', 'nationality_germany_austria_lichtenstein', 1),
+     ('b_nationality_italy', 'nationality_italy_vatican', 1),
+     ('b_nationality_france', 'nationality_france_monaco_san_marino', 1),
+     ('b_nationality_nw', 'nationality_northwestern_europe', 1),
+     ('b_nationality_south_west_europe', 'nationality_south_west_europe', 1),
+     ('b_nationality_southeast_europe', 'nationality_southeast_europe', 1),
+     ('b_nationality_e', 'nationality_eastern_europe', 1),
+     ('b_nb_less_than_15_in_hh', 'nb_less_than_15_in_hh', 1),
+     ('b_couple_without_children_30', 'couple_without_children_30', 1),
+     ('b_nb_less_than_6_in_hh', 'nb_less_than_6_in_hh', 0),
+     ('b_nb_between_6_and_15_in_hh', 'nb_between_6_and_15_in_hh', 1)]
+
+''' Parameters of the ordered logit and their starting values in Biogeme: tau1 is the first threshold, the next ones
+are tau_k = tau_(k-1) + delta_k '''
+THRESHOLD_PARAMETERS = {'tau1': -1.0, 'delta2': 2.0, 'delta3': 2.0, 'delta4': 2.0}
+''' Upper bound of tau1 in the estimation (the deltas are positive) '''
+TAU1_UPPER_BOUND = 3.0
+
+
+def get_free_terms(specification):
+    """ Terms (beta, feature) of the specification whose beta is not fixed at zero """
+    return [(term[0], term[1]) for term in specification if len(term) == 2 or term[2] == 0]
+
+
+def get_design_matrix(df, specification):
+    """ Compute the features of all terms of the specification whose beta is not fixed at zero.
+    :return: The names of the betas and an array with one row per row of df and one column per beta
+    """
+    specification = get_free_terms(specification)
+    beta_names = [beta_name for beta_name, feature_name in specification]
+    design_matrix = np.empty((len(df), len(specification)))
+    for i, (beta_name, feature_name) in enumerate(specification):
+        design_matrix[:, i] = get_feature(df, feature_name)
+    return beta_names, design_matrix
+
+
+def get_beta_vector(betas, beta_names):
+    """ Values of the betas in the order of beta_names. As in Biogeme, betas that are not given keep their starting
+    value, zero. """
+    return np.array([betas.get(beta_name, 0.0) for beta_name in beta_names], dtype=float)
+
+
+def get_thresholds(betas):
+    """ The four thresholds tau1 to tau4 of the ordered logit """
+    threshold_parameters = [betas.get(name, starting_value) for name, starting_value in THRESHOLD_PARAMETERS.items()]
+    return np.cumsum(threshold_parameters)
+
+
+def get_threshold_parameters(thresholds):
+    """ Parameters tau1, delta2, delta3 and delta4 of the four thresholds tau1 to tau4 (inverse of get_thresholds) """
+    parameters = np.diff(np.asarray(thresholds, dtype=float), prepend=0.0)
+    return {name: float(parameter) for name, parameter in zip(THRESHOLD_PARAMETERS, parameters)}
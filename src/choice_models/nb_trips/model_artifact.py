@@ -0,0 +1,129 @@
+""" Estimated model of the number of trips from home to work, saved as a small JSON file (the model artifact) that can
+be read and applied without Biogeme: the betas, the thresholds of the ordered logit, the covariance matrix of the
+parameters, the specification the betas were estimated with and the hash of the data of the estimation.
+"""
+import json
+import numpy as np
+from pathlib import Path
+from choice_models.nb_trips.home_work_specification import ESTIMATION_SPECIFICATION, get_free_terms, get_thresholds
+from choice_models.nb_trips.ordered_logit import simulate_ordered_logit
+from pipeline import get_file_hash
+
+MODEL_ARTIFACT_FILE_NAME = 'ordinalLogit.json'
+''' Version of the format of the model artifact, increased when the format changes '''
+MODEL_ARTIFACT_VERSION = 1
+''' Folder of the estimation of the model on the MTMC '''
+PATH_TO_ESTIMATION_FOLDER = Path('../data/output/models/nb_trips/WA/estimation/')
+
+
+def save_model_artifact(path_to_artifact, betas, covariance=None, specification=ESTIMATION_SPECIFICATION,
+                        path_to_data=None, engine=None, log_likelihood=None):
+    """ Save the estimated model in a JSON file
+    :param path_to_artifact: JSON file, usually MODEL_ARTIFACT_FILE_NAME in the folder of the estimation
+    :param betas: Dictionary with the values of the betas and of the parameters of the thresholds
+    :param covariance: Dataframe with the covariance matrix of the parameters, with their names as index and columns
+    (e.g., getVarCovar() of Biogeme or 'covariance' of estimate_ordered_logit)
+    :param specification: Specification the betas were estimated with (see home_work_specification)
+    :param path_to_data: Data file of the estimation (its MD5 hash is saved)
+    :param engine: Engine of the estimation ('biogeme' or 'native')
+    :param log_likelihood: Final log likelihood
+    """
+    model = {'version': MODEL_ARTIFACT_VERSION,
+             'engine': engine,
+             'betas': {name: float(value) for name, value in betas.items()},
+             'thresholds': get_thresholds(betas).tolist(),
+             'specification': [[beta_name, feature_name] for beta_name, feature_name in get_free_terms(specification)],
+             'covariance': None,
+             'data': None,
+             'log likelihood': None if log_likelihood is None else float(log_likelihood)}
+    if covariance is not None:
+        model['covariance'] = {'names': [str(name) for name in covariance.index],
+                               'values': covariance.to_numpy(dtype=float).tolist()}
+    if path_to_data is not None:
+        model['data'] = {'file': Path(path_to_data).name, 'md5': get_file_hash(Path(path_to_data), {})}
+    with open(path_to_artifact, 'w') as artifact_file:
+        json.dump(model, artifact_file, indent=1)
+
+
+def load_model_artifact(path_to_artifact, path_to_data=None):
+    """ Read a model saved by save_model_artifact, with NumPy only
+    :param path_to_data: Data file the model is used with, e.g., nb_trips.csv. A warning is printed if it is not the
+    data of the estimation (different MD5 hash). None: no check.
+    :return: A dictionary with 'betas' (name: value), 'thresholds' (array of tau1 to tau4), 'specification' (list of
+    terms (beta, feature)), 'covariance' (array, or None), 'parameter names' (names of the rows and columns of the
+    covariance matrix), 'data' (file and MD5 hash of the data of the estimation, or None), 'engine' and
+    'log likelihood'
+    """
+    with open(path_to_artifact, 'r') as artifact_file:
+        model = json.load(artifact_file)
+    if model.get('version') != MODEL_ARTIFACT_VERSION:
+        raise Exception('Version of the model artifact not well defined: ' + str(model.get('version')))
+    if path_to_data is not None:
+        check_data_of_estimation(model['data'], path_to_data)
+    covariance = model['covariance']
+    return {'betas': model['betas'],
+            'thresholds': np.array(model['thresholds'], dtype=float),
+            'specification': [tuple(term) for term in model['specification']],
+            'covariance': None if covariance is None else np.array(covariance['values'], dtype=float),
+            'parameter names': None if covariance is None else covariance['names'],
+            'data': model['data'],
+            'engine': model['engine'],
+            'log likelihood': model['log likelihood']}
+
+
+def check_data_of_estimation(data_of_estimation, path_to_data):
+    """ Print a warning if the data file is not the data of the estimation saved in the model artifact """
+    if data_of_estimation is None:
+        print('WARNING: The data of the estimation is not known, it cannot be compared to', path_to_data)
+    elif get_file_hash(Path(path_to_data), {}) != data_of_estimation['md5']:
+        print('WARNING: The model was estimated on another version of the data than', path_to_data)
+
+
+def simulate_model_artifact(df, path_to_artifact, path_to_data=None):
+    """ Probabilities of 0, 1, 2, 3 and 4+ trips from home to work of the model saved in an artifact, computed with
+    NumPy from the betas and the specification of the artifact only (see ordered_logit.simulate_ordered_logit)
+    :param df: Persons to simulate, with the columns of nb_trips.csv and the business sectors (e.g., only the persons
+    older than 14, as apply_home_work_model_to_microcensus)
+    :param path_to_data: Data file of df, compared to the data of the estimation (see load_model_artifact)
+    :return: A dataframe with the index of df, one column per alternative and the column 'expected nb of trips'
+    """
+    artifact = load_model_artifact(path_to_artifact, path_to_data)
+    return simulate_ordered_logit(df, artifact['betas'], artifact['specification'])
+
+
+def get_model(path_to_estimation_folder=PATH_TO_ESTIMATION_FOLDER, path_to_data=None):
+    """ Betas of the estimation saved in a folder and the specification they were estimated with: from the model
+    artifact if it exists (no Biogeme needed), otherwise from the pickle file of Biogeme (ordinalLogit.pickle, written
+    by estimation.home_work with ESTIMATION_SPECIFICATION)
+    :param path_to_data: Data file the model is used with, compared to the data of the estimation if the artifact
+    exists (see load_model_artifact)
+    :return: A dictionary with 'betas' (name: value) and 'specification' (list of terms (beta, feature))
+    """
+    path_to_estimation_folder = Path(path_to_estimation_folder)
+    path_to_artifact = path_to_estimation_folder / MODEL_ARTIFACT_FILE_NAME
+    if path_to_artifact.exists():
+        artifact = load_model_artifact(path_to_artifact, path_to_data)
+        return {'betas': artifact['betas'], 'specification': artifact['specification']}
+    import biogeme.results as res
+    if (path_to_estimation_folder / 'ordinalLogit~00.pickle').is_file():
+        print('WARNING: There are several model outputs!')
+    results = res.bioResults(pickleFile=path_to_estimation_folder / 'ordinalLogit.pickle')
+    return {'betas': results.getBetaValues(), 'specification': get_free_terms(ESTIMATION_SPECIFICATION)}
+
+
+def get_betas_and_specification(betas=None, specification=None, path_to_estimation_folder=PATH_TO_ESTIMATION_FOLDER,
+                                path_to_data=None):
+    """ Betas and specification used to apply the model, so that they always match: without betas, the model
+    estimated in path_to_estimation_folder (see get_model); with betas (e.g., betas with calibrated thresholds), the
+    specification they were estimated with must be given too.
+    :return: The betas and the specification
+    """
+    if betas is None:
+        if specification is not None:
+            raise Exception('Specification not well defined: it is the one of the estimation when betas is None')
+        model = get_model(path_to_estimation_folder, path_to_data)
+        return model['betas'], model['specification']
+    if specification is None:
+        raise Exception('Specification not well defined: give the specification the betas were estimated with '
+                        '(e.g., get_model(...)[\'specification\'])')
+    return betas, specification
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from choice_models.nb_trips.home_work_specification import get_design_matrix, get_beta_vector, get_thresholds
+
+''' Alternatives of the ordered logit: 0, 1, 2, 3 and 4+ trips from home to work '''
+ALTERNATIVES = [0, 1, 2, 3, 4]
+
+
+def logistic_cdf(x):
+    """ 1 / (1 + exp(-x)), without overflow for large negative x """
+    return np.exp(-np.logaddexp(0.0, -x))
+
+
+def get_probabilities(utilities, thresholds):
+    """ Probabilities of the ordered logit, as in Biogeme:
+        0: 1 - F(U - tau1)
+        k: F(U - tau_k) - F(U - tau_(k+1))
+        4+: F(U - tau4)
+    with F the logistic CDF.
+    :param utilities: Array with one utility per person
+    :param thresholds: Array with the four thresholds tau1 to tau4
+    :return: Array with one row per person and one column per alternative
+    """
+    cumulative_probabilities = logistic_cdf(utilities[:, np.newaxis] - thresholds[np.newaxis, :])
+    upper = np.hstack([np.ones((len(utilities), 1)), cumulative_probabilities])
+    lower = np.hstack([cumulative_probabilities, np.zeros((len(utilities), 1))])
+    return upper - lower
+
+
+def get_expected_nb_of_trips(probabilities):
+    return probabilities @ np.array(ALTERNATIVES, dtype=float)
+
+
+def get_utilities(df, betas, specification):
+    """ Linear utility of each row of df (without the thresholds) """
+    beta_names, design_matrix = get_design_matrix(df, specification)
+    return design_matrix @ get_beta_vector(betas, beta_names)
+
+
+def simulate_ordered_logit(df, betas, specification):
+    """ Probabilities of 0, 1, 2, 3 and 4+ trips from home to work, computed with NumPy instead of biogeme.simulate.
+    :param df: Data with the columns of nb_trips.csv
+    :param betas: Dictionary with the values of the betas, e.g., results.getBetaValues() of Biogeme
+    :param specification: List of terms (beta, feature) of the utility, the ones the betas were estimated with (see
+    model_artifact.get_model)
+    :return: A dataframe with the same index as df, one column per alternative (0 to 4, as biogeme.simulate) and the
+    column 'expected nb of trips'
+    """
+    utilities = get_utilities(df, betas, specification)
+    probabilities = get_probabilities(utilities, get_thresholds(betas))
+    df_results = pd.DataFrame(probabilities, index=df.index, columns=ALTERNATIVES)
+    df_results['expected nb of trips'] = get_expected_nb_of_trips(probabilities)
+    return df_results
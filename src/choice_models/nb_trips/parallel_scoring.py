@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from choice_models.nb_trips.ordered_logit import simulate_ordered_logit
+
+''' Betas and specification of a worker process, sent once when the process starts '''
+_worker_model = {}
+
+
+def _initialize_worker(betas, specification):
+    _worker_model['betas'] = betas
+    _worker_model['specification'] = specification
+
+
+def _call_in_worker(function, partition):
+    return function(partition, _worker_model['betas'], _worker_model['specification'])
+
+
+def map_in_order(function, partitions, betas, specification, nb_of_processes=None,
+                 max_pending_partitions=None):
+    """ Apply function(partition, betas, specification) to each partition in a pool of processes.
+    The betas and the specification are sent once per process, not with every partition. The results are returned in
+    the order of the partitions, and at most max_pending_partitions partitions are sent at the same time, so that
+    partitions can be read lazily (e.g., chunks of a file).
+    :param nb_of_processes: Number of worker processes (None: number of CPUs)
+    :param max_pending_partitions: Maximal number of partitions in the pool (None: twice the number of processes)
+    :return: A generator of results
+    """
+    if nb_of_processes is None:
+        nb_of_processes = os.cpu_count()
+    if max_pending_partitions is None:
+        max_pending_partitions = 2 * nb_of_processes
+    with ProcessPoolExecutor(max_workers=nb_of_processes, initializer=_initialize_worker,
+                             initargs=(betas, specification)) as executor:
+        pending_results = deque()
+        for partition in partitions:
+            pending_results.append(executor.submit(_call_in_worker, function, partition))
+            if len(pending_results) >= max_pending_partitions:
+                yield pending_results.popleft().result()
+        while pending_results:
+            yield pending_results.popleft().result()
+
+
+def simulate_ordered_logit_in_parallel(df, betas, specification, nb_of_processes=None,
+                                       partition_column=None, nb_of_partitions=None):
+    """ Same as ordered_logit.simulate_ordered_logit, with the persons split between several processes.
+    :param nb_of_processes: Number of worker processes (None: number of CPUs)
+    :param partition_column: Column defining the partitions, e.g., 'region' (None: ranges of rows). Rows with a missing
+    value of the column are in their own partition.
+    :param nb_of_partitions: Number of ranges of rows if partition_column is None (None: 4 per process)
+    :return: A dataframe with the same index and order as df (see simulate_ordered_logit)
+    """
+    if len(df) == 0:
+        return simulate_ordered_logit(df, betas, specification)
+    if nb_of_processes is None:
+        nb_of_processes = os.cpu_count()
+    ''' The partitions are defined by the positions of their rows (the index of df may have duplicate labels) '''
+    if partition_column is not None:
+        group_numbers = df.groupby(partition_column, sort=False, dropna=False).ngroup().to_numpy()
+        sorted_positions = np.argsort(group_numbers, kind='stable')
+        partition_starts = np.flatnonzero(np.diff(group_numbers[sorted_positions])) + 1
+        partition_positions = np.split(sorted_positions, partition_starts)
+    else:
+        if nb_of_partitions is None:
+            nb_of_partitions = 4 * nb_of_processes
+        partition_positions = np.array_split(np.arange(len(df)), min(nb_of_partitions, max(len(df), 1)))
+    partition_positions = [positions for positions in partition_positions if len(positions) > 0]
+    partitions = (df.iloc[positions] for positions in partition_positions)
+    df_results = pd.concat(list(map_in_order(simulate_ordered_logit, partitions, betas, specification,
+                                             nb_of_processes=nb_of_processes)))
+    ''' Results in the order of the rows of df '''
+    results = np.empty(df_results.shape)
+    results[np.concatenate(partition_positions)] = df_results.to_numpy(dtype=float)
+    return pd.DataFrame(results, index=df.index, columns=df_results.columns)
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import pandas as pd
+from pathlib import Path
+from mtmc2015.utils2015.compute_confidence_interval import get_weighted_avg_and_ci_from_sums
+from utils_mtmc.columnar_cache import get_source_key
+from utils_mtmc.nb_trips_schema import TRIP_PURPOSE_COLUMNS, read_nb_trips
+
+PATH_TO_NB_TRIPS = Path('../data/output/data/estimation/nb_trips.csv')
+OUTPUT_DIRECTORY = Path('../data/output/descriptive_statistics/')
+''' Number of trips per purpose in nb_trips.csv (WAA and WASK are grouped in WA, the trips from home to work) '''
+PURPOSE_COLUMNS = ['WA'] + [column for column in TRIP_PURPOSE_COLUMNS if column not in ['WAA', 'WASK']]
+''' Age groups (upper bound included) '''
+AGE_GROUPS = {'0-14': 14, '15-17': 17, '18-24': 24, '25-44': 44, '45-64': 64, '65-79': 79, '80+': 200}
+''' Cross-tabs computed by default. [] is the total population. '''
+DEFAULT_TABULATIONS = [[],
+                       ['sex'],
+                       ['age_group'],
+                       ['work_position'],
+                       ['city_typology'],
+                       ['region'],
+                       ['hh_type'],
+                       ['sex', 'age_group'],
+                       ['work_position', 'city_typology']]
+''' Value of the attributes that are not part of a cross-tab, in the table of results '''
+ALL_VALUES = 'All'
+
+
+def get_stats(tabulations=None, purposes=None, weights='WP', use_cache=True):
+    """ Weighted number of trips per person and per day (trip rates), by purpose and by combinations of attributes of
+    the persons and households, from the aggregated data of the MTMC (nb_trips.csv).
+    The results are saved in OUTPUT_DIRECTORY (trip_rates.csv) and are read from there as long as nb_trips.csv and the
+    parameters do not change.
+    :param tabulations: List of cross-tabs, each a list of columns of nb_trips.csv (or 'age_group'), e.g.,
+    [[], ['sex'], ['sex', 'age_group']] (None: DEFAULT_TABULATIONS)
+    :param purposes: Columns with the number of trips per purpose (None: all columns of PURPOSE_COLUMNS in the data)
+    :param weights: Column with the weights of the persons
+    :param use_cache: If False, the trip rates are computed again
+    :return: A tidy dataframe with one row per cross-tab, cell and purpose (see get_trip_rates)
+    """
+    if tabulations is None:
+        tabulations = DEFAULT_TABULATIONS
+    tabulations = [list(tabulation) for tabulation in tabulations]
+    cache_key = get_cache_key(tabulations, purposes, weights)
+    path_to_results = OUTPUT_DIRECTORY / 'trip_rates.csv'
+    path_to_metadata = OUTPUT_DIRECTORY / 'trip_rates.json'
+    if use_cache and path_to_results.exists() and read_cache_key(path_to_metadata) == cache_key:
+        return pd.read_csv(path_to_results, sep=';')
+    df_nb_trips = read_nb_trips(PATH_TO_NB_TRIPS)
+    df_nb_trips = add_age_groups(df_nb_trips)
+    if purposes is None:
+        purposes = [column for column in PURPOSE_COLUMNS if column in df_nb_trips]
+    df_trip_rates = get_trip_rates(df_nb_trips, tabulations, purposes, weights)
+    OUTPUT_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    df_trip_rates.to_csv(path_to_results, sep=';', index=False)
+    with open(path_to_metadata, 'w') as metadata_file:
+        json.dump({'key': cache_key}, metadata_file)
+    return df_trip_rates
+
+
+def get_trip_rates(df, tabulations, purposes, weights='WP'):
+    """ Weighted averages and confidence intervals (see compute_confidence_interval) of the number of trips per purpose,
+    for all cross-tabs. The data is grouped once by all attributes of all cross-tabs. Each cross-tab is then a roll-up
+    of these cells, since the sums of the weights, of the weighted values and of their squares can be added.
+    :param df: Data with one row per person
+    :return: A tidy dataframe with the columns 'tabulation', the attributes (ALL_VALUES for the attributes that are
+    not in the cross-tab), 'column' (the purpose), 'weighted average', 'confidence interval', 'nb of observations' and
+    'sum of weights'
+    """
+    attributes = list(dict.fromkeys(attribute for tabulation in tabulations for attribute in tabulation))
+    df_cells = get_sums_by_cell(df, attributes, purposes, weights)
+    sum_columns = ['sum of weights', 'weighted sum', 'weighted sum of squares', 'nb of observations']
+    list_of_sums = []
+    for tabulation in tabulations:
+        df_sums = df_cells.groupby(tabulation + ['column'], sort=True, dropna=False)[sum_columns].sum().reset_index()
+        for attribute in attributes:
+            if attribute not in tabulation:
+                df_sums[attribute] = ALL_VALUES
+        df_sums.insert(0, 'tabulation', ' x '.join(tabulation) if tabulation else 'Total')
+        list_of_sums.append(df_sums[['tabulation'] + attributes + ['column'] + sum_columns])
+    return get_weighted_avg_and_ci_from_sums(pd.concat(list_of_sums, ignore_index=True))
+
+
+def get_sums_by_cell(df, attributes, purposes, weights='WP'):
+    """ Sums of the weights, of the weighted number of trips and of its square, and number of persons, in each cell
+    of the cross-tab of all attributes, computed in one grouped pass over the data. Missing values of the attributes
+    are kept as a cell.
+    :return: A tidy dataframe with the attributes, 'column' (the purpose) and the sums
+    """
+    weight_values = df[weights].astype(float)
+    trips = df[purposes].astype(float)
+    df_products = pd.concat([df[attributes],
+                             pd.DataFrame({'sum of weights': weight_values, 'nb of observations': 1},
+                                          index=df.index),
+                             trips.mul(weight_values, axis=0).add_prefix('weighted sum|'),
+                             (trips ** 2).mul(weight_values, axis=0).add_prefix('weighted sum of squares|')], axis=1)
+    if attributes:
+        df_cells = df_products.groupby(attributes, sort=False, dropna=False).sum().reset_index()
+    else:
+        df_cells = df_products.sum().to_frame().T
+    list_of_cells = []
+    for purpose in purposes:
+        df_cells_of_purpose = df_cells[attributes + ['sum of weights', 'nb of observations']].copy()
+        df_cells_of_purpose['column'] = purpose
+        df_cells_of_purpose['weighted sum'] = df_cells['weighted sum|' + purpose]
+        df_cells_of_purpose['weighted sum of squares'] = df_cells['weighted sum of squares|' + purpose]
+        list_of_cells.append(df_cells_of_purpose)
+    return pd.concat(list_of_cells, ignore_index=True)
+
+
+def add_age_groups(df, age='age'):
+    """ Column 'age_group' with the groups of AGE_GROUPS """
+    df = df.copy()
+    df['age_group'] = pd.cut(df[age], bins=[-1] + list(AGE_GROUPS.values()), labels=list(AGE_GROUPS)).astype(str)
+    return df
+
+
+def get_cache_key(tabulations, purposes, weights):
+    """ Hash of the modification time and size of nb_trips.csv and of the parameters of get_stats """
+    key = {'source': get_source_key(PATH_TO_NB_TRIPS, {}), 'tabulations': tabulations, 'purposes': purposes,
+           'weights': weights}
+    return hashlib.md5(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def read_cache_key(path_to_metadata):
+    if not path_to_metadata.exists():
+        return None
+    with open(path_to_metadata, 'r') as metadata_file:
+        return json.load(metadata_file)['key']
@@ -1,17 +1,29 @@
 import pandas as pd
-import pyreadstat
 from pathlib import Path
-import geopandas
 import numpy as np
 from choice_models.nb_trips.estimation.home_work import run_estimation_home_work
-from utils_mtmc.get_mtmc_files import get_trips, get_zp, get_hh, get_hhp
+from utils_mtmc.get_mtmc_files import get_trips, get_zp, get_hh, get_hhp, get_trips_from_combined_analysis_file
 from mtmc2015.utils2015.compute_confidence_interval import get_weighted_avg_and_std
+from utils_spatial.commune_typology import add_commune_typology
+from utils_spatial.distances import get_planar_distances, MISSING_COORDINATE
+from features.household_composition import add_household_composition
+from features.business_sectors import add_business_sectors
+from utils_mtmc.nb_trips_schema import TRIP_PURPOSE_COLUMNS, read_nb_trips, write_nb_trips
 
 
 def estimate_choice_model():
     # Generation of the data
+    generate_nb_trips_data_file()
+    # Compute average number of trips and estimation
+    estimate_choice_model_on_nb_trips_data_file()
+
+
+def generate_nb_trips_data_file():
     df_trips = get_trips_with_decomposed_round_trips()
     generate_data_file(df_trips)
+
+
+def estimate_choice_model_on_nb_trips_data_file():
     # Compute average number of trips
     compute_average_number_of_trips()
     # Estimation
@@ -24,7 +36,7 @@ def estimate_choice_model():
 def compute_average_number_of_trips():
     output_directory = Path('../data/output/data/estimation/')
     data_file_name = 'nb_trips.csv'
-    df_agg_trips = pd.read_csv(output_directory / data_file_name, sep=';')
+    df_agg_trips = read_nb_trips(output_directory / data_file_name)
     ''' Removing children 14 years old and younger. We assume that they do 0 trips to work. '''
     df_agg_trips.drop(df_agg_trips[df_agg_trips.age <= 14].index, inplace=True)
     ''' Removing unemployed people: They don't go to work '''
@@ -52,9 +64,9 @@ def get_trips_with_decomposed_round_trips():
     # df_raw_trips = df_raw_trips[(df_raw_trips['tag'] != 6) & (df_raw_trips['tag'] != 7)]
     # df_trips = aggregate_trip_per_person(df_trips)
     # df_trips = add_urban_typology(df_trips)
-    """ Directly from a cleaned version """
-    folder_path = Path('../data/input/mtmc/2015/')
-    df_trips, meta = pyreadstat.read_sav(str(folder_path / 'MZMV_2015_Kombiniert_Analysen.sav'))
+    """ Directly from a cleaned version, reading only the columns used in generate_data_file, from Monday to Friday """
+    df_trips = get_trips_from_combined_analysis_file(2015, selected_columns=['HHNR'] + TRIP_PURPOSE_COLUMNS,
+                                                     weekdays_only=True)
     return df_trips
 
 
@@ -69,32 +81,7 @@ def generate_data_file(df_trips):
     df_trips = df_trips[df_trips['tag'] <= 5]
     ''' Sum the number of trips per person using the dataset from the national transport model 
     (originally: data of the Mobility and Transport Microcensus - MTMC) '''
-    df_agg_trips = df_trips.groupby('HHNR').agg({'WAA': 'sum',
-                                                 'WASK': 'sum',
-                                                 'WBS': 'sum',
-                                                 'WBU': 'sum',
-                                                 'WEk': 'sum',
-                                                 'WEl': 'sum',
-                                                 'WN': 'sum',
-                                                 'WBgK': 'sum',
-                                                 'WFk': 'sum',
-                                                 'WFl': 'sum',
-                                                 'AAW': 'sum',
-                                                 'ASKW': 'sum',
-                                                 'BSW': 'sum',
-                                                 'BUW': 'sum',
-                                                 'EkW': 'sum',
-                                                 'ElW': 'sum',
-                                                 'NW': 'sum',
-                                                 'BgKW': 'sum',
-                                                 'FkW': 'sum',
-                                                 'FlW': 'sum',
-                                                 'AS': 'sum',
-                                                 'SA': 'sum',
-                                                 'AEkFk': 'sum',
-                                                 'EkFkA': 'sum',
-                                                 'EkFkEkFk': 'sum',
-                                                 'SS': 'sum'})
+    df_agg_trips = df_trips.groupby('HHNR').agg(dict.fromkeys(TRIP_PURPOSE_COLUMNS, 'sum'))
     ''' Group the number of trips to work '''
     df_agg_trips['WA'] = df_agg_trips['WAA'] + df_agg_trips['WASK']
     del df_agg_trips['WAA']
@@ -113,62 +100,19 @@ def generate_data_file(df_trips):
     df_hh = get_hh(2015, selected_columns_hh)
     df_agg_trips = pd.merge(df_agg_trips, df_hh, on='HHNR', how='left')
 
-    ''' Define the business sectors:
-        The 10 business sectors are an aggregation of the General Classification of Economic Activities (NOGA 2008) 
-        defined by the Swiss Federal Statistical Office (FSO).
-        The correspondence between NOGA codes and the aggregation can be found in:
-        Balz Bodenmann, Pascal Buerki, Camilla Philipp, Nadja Bernhard, Kirill Mueller, Andreas Justen, Antonin Danalet, 
-        Nicole A. Mathys, Wolfgang Scherr, Denis Metrailler, and Nathalie Frischknecht. Synthetische Population 2017 - 
-        Modellierung mit dem Flaechennutzungsmodell FaLC. Technical report, Federal Office for Spatial Development ARE 
-        and Swiss Federal Railways SBB, Bern, 2019, 
-        https://www.are.admin.ch/are/de/home/medien-und-publikationen/publikationen/grundlagen/synthetische-population-2017.html
-        The correspondence between the numeric NOGA codes and the names of the economic activities can be found in:
-        Federal Statistical Office. NOGA 2008, General Classification of Economic Activities - Structure. Technical 
-        report, Federal Statistical Office, Neuchatel, 2008, 
-        https://www.bfs.admin.ch/bfs/en/home/statistics/industry-services/nomenclatures/noga/publications-noga-2008.assetdetail.344622.html
-        '''
-    df_agg_trips['business_sector_agriculture'] = np.where((1 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 7), 1, 0)
-    df_agg_trips['business_sector_retail'] = np.where((df_agg_trips['noga_08'] == 47) | (df_agg_trips['noga_08'] == 48), 1, 0)
-    df_agg_trips['business_sector_gastronomy'] = np.where((55 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 57), 1, 0)
-    df_agg_trips['business_sector_finance'] = np.where((64 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 67), 1, 0)
-    df_agg_trips['business_sector_production'] = np.where(((10 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 35)) |
-                                                   ((40 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 44)), 1, 0)
-    df_agg_trips['business_sector_wholesale'] = np.where(((45 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 46)) |
-                                                  ((49 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 54)), 1, 0)
-    df_agg_trips['business_sector_services_fc'] = np.where(((60 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 63)) |
-                                                    ((69 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 83)) |
-                                                    (df_agg_trips['noga_08'] == 58), 1, 0)
-    df_agg_trips['business_sector_other_services'] = np.where(((86 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 90)) |
-                                                       ((92 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 96)) |
-                                                       (df_agg_trips['noga_08'] == 59) |
-                                                       (df_agg_trips['noga_08'] == 68), 1, 0)
-    df_agg_trips['business_sector_others'] = np.where((97 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 98), 1, 0)
-    df_agg_trips['business_sector_non_movers'] = np.where(((8 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 9)) |
-                                                   ((36 <= df_agg_trips['noga_08']) & (df_agg_trips['noga_08'] <= 39)) |
-                                                   (df_agg_trips['noga_08'] == 84) | (df_agg_trips['noga_08'] == 85) |
-                                                   (df_agg_trips['noga_08'] == 91) | (df_agg_trips['noga_08'] == 99), 1, 0)
-    del df_agg_trips['noga_08']
+    ''' Define the business sectors: the 10 business sectors are an aggregation of the General Classification of
+    Economic Activities (NOGA 2008) defined by the Swiss Federal Statistical Office (FSO), see features.business_sectors
+    '''
+    df_agg_trips = add_business_sectors(df_agg_trips, noga_column='noga_08')
 
-    ''' Add the distance between home and work places '''
-    df_agg_trips_with_work_coord = df_agg_trips[df_agg_trips.A_X_CH1903 != -999]
-    geodf_home = geopandas.GeoDataFrame(df_agg_trips_with_work_coord,
-                                        geometry=geopandas.points_from_xy(df_agg_trips_with_work_coord.W_Y_CH1903,
-                                                                          df_agg_trips_with_work_coord.W_X_CH1903),
-                                        crs='epsg:21781')
-    geodf_work = geopandas.GeoDataFrame(df_agg_trips_with_work_coord,
-                                        geometry=geopandas.points_from_xy(df_agg_trips_with_work_coord.A_Y_CH1903,
-                                                                          df_agg_trips_with_work_coord.A_X_CH1903),
-                                        crs='epsg:21781')
-    df_agg_trips.loc[df_agg_trips.A_X_CH1903 != -999, 'home_work_crow_fly_distance'] = geodf_home.distance(geodf_work)
-    df_agg_trips['home_work_crow_fly_distance'].fillna(-999, inplace=True)
+    ''' Add the distance between home and work places (-999 if the work place is not known) '''
+    home_work_distances = get_planar_distances(df_agg_trips['W_Y_CH1903'], df_agg_trips['W_X_CH1903'],
+                                               df_agg_trips['A_Y_CH1903'], df_agg_trips['A_X_CH1903'])
+    df_agg_trips['home_work_crow_fly_distance'] = np.nan_to_num(home_work_distances, nan=MISSING_COORDINATE)
+    ''' Add the data about the spatial typology (from the coordinates of home if the BFS commune number is missing) '''
+    df_agg_trips = add_commune_typology(df_agg_trips, bfs_column='W_BFS', typology_columns=['Stadt/Land-Typologie'],
+                                        coordinate_columns=('W_Y_CH1903', 'W_X_CH1903'))
     df_agg_trips.drop(['W_Y_CH1903', 'W_X_CH1903', 'A_Y_CH1903', 'A_X_CH1903'], axis=1, inplace=True)
-    ''' Add the data about the spatial typology '''
-    path_to_typology = Path('../data/input/StadtLandTypologie/2015/Raumgliederungen.xlsx')
-    df_typology = pd.read_excel(path_to_typology, sheet_name='Daten',
-                                skiprows=[0, 2],  # Removes the 1st row, with information, and the 2nd, with links
-                                usecols='A,G')  # Selects only the BFS commune number and the column with the typology
-    df_agg_trips = pd.merge(df_agg_trips, df_typology, left_on='W_BFS', right_on='BFS Gde-nummer', how='left')
-    df_agg_trips.drop('BFS Gde-nummer', axis=1, inplace=True)
     ''' Generate the variable about work position:
     Code FaLC in English     FaLC in German   NPVM                       Code used below
      0   Unemployed                                                      0
@@ -202,14 +146,8 @@ def generate_data_file(df_trips):
     ''' Add data about other members of the household '''
     selected_columns_hhp = ['HHNR', 'alter']
     df_hhp = get_hhp(2015, selected_columns=selected_columns_hhp)
-    # Number of children 15 years old or less
-    df_hhp['less_than_15'] = df_hhp.apply(lambda x: 1 if x['alter'] <= 15 else 0, axis=1)
-    df_hhp_less_than_15_per_hh = df_hhp[['HHNR', 'less_than_15']].groupby(['HHNR']).sum()
-    df_agg_trips = pd.merge(df_agg_trips, df_hhp_less_than_15_per_hh, left_on='HHNR', right_on='HHNR', how='left')
-    # Number of children 6 years old or less
-    df_hhp['less_than_6'] = df_hhp.apply(lambda x: 1 if x['alter'] <= 6 else 0, axis=1)
-    df_hhp_less_than_6_per_hh = df_hhp[['HHNR', 'less_than_6']].groupby(['HHNR']).sum()
-    df_agg_trips = pd.merge(df_agg_trips, df_hhp_less_than_6_per_hh, left_on='HHNR', right_on='HHNR', how='left')
+    # Number of children 6 and 15 years old or less, of adults and of elderly people, computed in one pass
+    df_agg_trips = add_household_composition(df_agg_trips, df_hhp, household_id='HHNR', age='alter')
     # Rename the variables
     df_agg_trips = df_agg_trips.rename(columns={'gesl': 'sex',
                                                 'alter': 'age',
@@ -242,10 +180,8 @@ def generate_data_file(df_trips):
                                                 'f40900': 'full_part_time_job',
                                                 'f40901_02': 'percentage_first_part_time_job',
                                                 'f40903': 'percentage_second_part_time_job',
-                                                'less_than_15': 'nb_less_than_15_in_hh',
-                                                'less_than_6': 'nb_less_than_6_in_hh',
                                                 'BSTELL': 'work_position'})
-    ''' Save the file '''
+    ''' Save the file, with the compact types of utils_mtmc.nb_trips_schema '''
     output_directory = Path('../data/output/data/estimation/')
     data_file_name = 'nb_trips.csv'
-    df_agg_trips.to_csv(output_directory / data_file_name, sep=';', index=False)
+    write_nb_trips(df_agg_trips, output_directory / data_file_name)
@@ -0,0 +1,65 @@
+import numpy as np
+
+''' The 10 business sectors are an aggregation of the General Classification of Economic Activities (NOGA 2008)
+defined by the Swiss Federal Statistical Office (FSO), with the 2-digit NOGA codes (divisions) of each sector.
+The correspondence between NOGA codes and the aggregation can be found in:
+Balz Bodenmann, Pascal Buerki, Camilla Philipp, Nadja Bernhard, Kirill Mueller, Andreas Justen, Antonin Danalet,
+Nicole A. Mathys, Wolfgang Scherr, Denis Metrailler, and Nathalie Frischknecht. Synthetische Population 2017 -
+Modellierung mit dem Flaechennutzungsmodell FaLC. Technical report, Federal Office for Spatial Development ARE
+and Swiss Federal Railways SBB, Bern, 2019,
+https://www.are.admin.ch/are/de/home/medien-und-publikationen/publikationen/grundlagen/synthetische-population-2017.html
+The correspondence between the numeric NOGA codes and the names of the economic activities can be found in:
+Federal Statistical Office. NOGA 2008, General Classification of Economic Activities - Structure. Technical
+report, Federal Statistical Office, Neuchatel, 2008,
+https://www.bfs.admin.ch/bfs/en/home/statistics/industry-services/nomenclatures/noga/publications-noga-2008.assetdetail.344622.html
+'''
+NOGA_RANGES_PER_BUSINESS_SECTOR = {'agriculture': [(1, 7)],
+                                   'retail': [(47, 48)],
+                                   'gastronomy': [(55, 57)],
+                                   'finance': [(64, 67)],
+                                   'production': [(10, 35), (40, 44)],
+                                   'wholesale': [(45, 46), (49, 54)],
+                                   'services_fc': [(58, 58), (60, 63), (69, 83)],
+                                   'other_services': [(59, 59), (68, 68), (86, 90), (92, 96)],
+                                   'others': [(97, 98)],
+                                   'non_movers': [(8, 9), (36, 39), (84, 85), (91, 91), (99, 99)]}
+BUSINESS_SECTORS = list(NOGA_RANGES_PER_BUSINESS_SECTOR)
+BUSINESS_SECTOR_COLUMNS = ['business_sector_' + business_sector for business_sector in BUSINESS_SECTORS]
+NO_BUSINESS_SECTOR = len(BUSINESS_SECTORS)
+
+
+def get_noga_to_business_sector_lookup():
+    """ Array giving, for each NOGA code from 0 to 99, the index of its business sector in BUSINESS_SECTORS
+    (NO_BUSINESS_SECTOR for codes outside all sectors) """
+    lookup = np.full(100, NO_BUSINESS_SECTOR, dtype=np.int8)
+    for business_sector_id, business_sector in enumerate(BUSINESS_SECTORS):
+        for first_noga_code, last_noga_code in NOGA_RANGES_PER_BUSINESS_SECTOR[business_sector]:
+            lookup[first_noga_code:last_noga_code + 1] = business_sector_id
+    return lookup
+
+
+NOGA_TO_BUSINESS_SECTOR = get_noga_to_business_sector_lookup()
+''' One row per business sector, plus a last row of zeros for persons without business sector '''
+BUSINESS_SECTOR_ONE_HOT = np.vstack([np.eye(NO_BUSINESS_SECTOR, dtype=np.int8),
+                                     np.zeros((1, NO_BUSINESS_SECTOR), dtype=np.int8)])
+
+
+def encode_business_sectors(noga_codes):
+    """ One-hot encoding of the business sectors in a single indexing operation.
+    :param noga_codes: Array-like of 2-digit NOGA 2008 codes (negative codes, NaN and codes above 99 have no sector)
+    :return: An array (int8) with one row per code and one column per business sector (see BUSINESS_SECTOR_COLUMNS)
+    """
+    noga_codes = np.asarray(noga_codes, dtype=float)
+    is_valid = np.isfinite(noga_codes) & (noga_codes >= 0) & (noga_codes < len(NOGA_TO_BUSINESS_SECTOR))
+    business_sector_ids = np.where(is_valid,
+                                   NOGA_TO_BUSINESS_SECTOR[np.where(is_valid, noga_codes, 0).astype(np.int64)],
+                                   NO_BUSINESS_SECTOR)
+    return BUSINESS_SECTOR_ONE_HOT[business_sector_ids]
+
+
+def add_business_sectors(df, noga_column='noga_08', drop_noga_column=True):
+    """ Add the columns business_sector_* (0/1) to df from the NOGA codes in noga_column """
+    df[BUSINESS_SECTOR_COLUMNS] = encode_business_sectors(df[noga_column])
+    if drop_noga_column:
+        del df[noga_column]
+    return df
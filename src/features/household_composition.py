@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+''' Age bands counted per household: name of the new column, minimal age and maximal age (both included) '''
+AGE_BANDS = [('nb_less_than_6_in_hh', None, 6),
+             ('nb_less_than_15_in_hh', None, 15),
+             ('nb_adults_in_hh', 18, None),
+             ('nb_elderly_in_hh', 65, None)]
+
+
+def get_household_composition(df_persons, household_id='HHNR', age='alter', employment_column=None,
+                              employed_codes=(1, 2)):
+    """ Count the members of each household by age band (and the number of workers) in a single grouped pass over the
+    persons. Persons with an unknown age (NaN) are not counted in any age band.
+    :param df_persons: One row per person, e.g., haushaltspersonen.csv of the MTMC or a synthetic population
+    :param household_id: Column identifying the household
+    :param age: Column with the age of the person
+    :param employment_column: Column with the employment status (None: the number of workers is not computed)
+    :param employed_codes: Codes of employment_column for working persons (default: full and part time in ERWERB)
+    :return: A dataframe indexed by household_id, with one column per age band (see AGE_BANDS) and 'nb_workers_in_hh'
+    """
+    ages = df_persons[age].to_numpy(dtype=float)
+    counts = {household_id: df_persons[household_id].to_numpy()}
+    for column_name, minimal_age, maximal_age in AGE_BANDS:
+        in_band = np.isfinite(ages)
+        if minimal_age is not None:
+            in_band &= ages >= minimal_age
+        if maximal_age is not None:
+            in_band &= ages <= maximal_age
+        counts[column_name] = in_band.astype(np.int16)
+    if employment_column is not None:
+        counts['nb_workers_in_hh'] = df_persons[employment_column].isin(employed_codes).to_numpy(dtype=np.int16)
+    return pd.DataFrame(counts).groupby(household_id, sort=False).sum()
+
+
+def add_household_composition(df, df_persons, household_id='HHNR', **composition_arguments):
+    """ Add the household composition (see get_household_composition) to df with a single left merge """
+    df_household_composition = get_household_composition(df_persons, household_id=household_id,
+                                                          **composition_arguments)
+    return pd.merge(df, df_household_composition, left_on=household_id, right_index=True, how='left')
@@ -0,0 +1,32 @@
+from pathlib import Path
+from choice_models.nb_trips.forecasting import get_base_population, forecast_scenarios
+from choice_models.nb_trips.model_artifact import get_betas_and_specification
+from features.business_sectors import add_business_sectors
+from utils_mtmc.nb_trips_schema import read_nb_trips
+
+
+def forecast_choice_model(scenarios, betas=None, specification=None, groupby=None, block_size=100000):
+    """ Number of trips from home to work in several scenarios (e.g., 2015 to 2030), applied to the persons of the
+    MTMC (see choice_models.nb_trips.forecasting). The design matrix of the persons is computed once for all scenarios.
+    The results are saved in ../data/output/models/nb_trips/WA/forecasts/scenarios.csv.
+    :param scenarios: List of scenarios, e.g., [{'name': '2015'}, {'name': '2030', 'shares': {'working_from_home': 0.3},
+    'weights': weights_2030}]
+    :param betas: Dictionary with the values of the betas (None: betas of the estimation on the MTMC)
+    :param specification: Specification the betas were estimated with (None, with betas None: the one of the
+    estimation on the MTMC, see model_artifact.get_betas_and_specification)
+    :param groupby: Column or list of columns of nb_trips.csv splitting the results in groups (None: no groups)
+    :param block_size: Number of persons simulated at once
+    :return: A dataframe with one row per scenario and group (see forecast_scenarios)
+    """
+    path_to_nb_trips = Path('../data/output/data/estimation/nb_trips.csv')
+    betas, specification = get_betas_and_specification(betas, specification, path_to_data=path_to_nb_trips)
+    df_nb_trips = read_nb_trips(path_to_nb_trips)
+    if 'noga_08' in df_nb_trips:
+        ''' Data files with NOGA codes instead of business sectors (the data file of the MTMC has the sectors) '''
+        df_nb_trips = add_business_sectors(df_nb_trips, noga_column='noga_08')
+    base_population = get_base_population(df_nb_trips, specification, weights='WP', groupby=groupby)
+    df_forecasts = forecast_scenarios(base_population, betas, scenarios, block_size=block_size)
+    output_directory = Path('../data/output/models/nb_trips/WA/forecasts/')
+    df_forecasts.to_csv(output_directory / 'scenarios.csv', sep=';', index=False)
+    print(df_forecasts)
+    return df_forecasts
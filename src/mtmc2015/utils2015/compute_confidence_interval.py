@@ -1,42 +1,171 @@
 # coding=latin-1
 
 import numpy as np
+import pandas as pd
+
+''' Factor of the confidence intervals of the MTMC: 90% (1.645) and design effect of the survey (1.14) '''
+MAGIC_NUMBER = 1.14
+Z_VALUE_90_PERCENT = 1.645
+''' Columns of the tables of get_weighted_sums that are not about the segments '''
+SUM_COLUMNS = ['column', 'sum of weights', 'weighted sum', 'weighted sum of squares', 'nb of observations']
 
 
 def get_weighted_avg_and_std(table, weights, percentage=False, list_of_columns=None):
-    if 'ZIELPNR' in table:
-        table['unique_identifier'] = table['HHNR'] * 10 + table['ZIELPNR']
-        nb_of_obs = len(table['unique_identifier'].unique())
-        del table['unique_identifier']
-    else:
-        nb_of_obs = len(table['HHNR'].unique())
-    dict_column_weighted_avg_and_std = {}
+    """ Weighted averages and confidence intervals of columns in the whole table (see get_weighted_avg_and_ci).
+    :return: A dictionary with, for each column, a list [weighted average, confidence interval], and the number of
+    observations (persons if ZIELPNR is in the table, otherwise households)
+    """
     if list_of_columns is None:
         list_of_columns = table.columns
-    magic_number = 1.14
-    if percentage:
-        sum_all_columns = 0.0
-        for column in list_of_columns:
-            if column in table:
-                weighted_avg, weighted_std = weighted_avg_and_std(table[column], table[weights])
-                sum_all_columns += weighted_avg
-                dict_column_weighted_avg_and_std[column] = weighted_avg
-        for column in list_of_columns:
-            if column in dict_column_weighted_avg_and_std:
-                weighted_percentage = np.divide(dict_column_weighted_avg_and_std[column], sum_all_columns)
-            else:
-                weighted_percentage = 0.0
-            variance = 1.645 * magic_number * np.sqrt(np.divide(weighted_percentage * (1.0-weighted_percentage),
-                                                                float(nb_of_obs)))
-            dict_column_weighted_avg_and_std[column] = [weighted_percentage, variance]
-    else:
-        for column in list_of_columns:
-            if column in table:
-                weighted_avg, weighted_std = weighted_avg_and_std(table[column], table[weights])
-                dict_column_weighted_avg_and_std[column] = [weighted_avg,
-                                                            np.divide(1.645 * magic_number * weighted_std,
-                                                                      np.sqrt(nb_of_obs))]
-    return dict_column_weighted_avg_and_std, nb_of_obs
+    df_stats = get_weighted_avg_and_ci(table, weights, list_of_columns, percentage=percentage)
+    dict_column_weighted_avg_and_std = {column: [weighted_avg, confidence_interval]
+                                        for column, weighted_avg, confidence_interval
+                                        in zip(df_stats['column'], df_stats['weighted average'],
+                                               df_stats['confidence interval'])}
+    return dict_column_weighted_avg_and_std, get_nb_of_observations(table)
+
+
+def get_weighted_avg_and_ci(table, weights, list_of_columns, segments=None, groupby=None, percentage=False):
+    """ Weighted averages and confidence intervals of many columns in many segments of the table, in one pass over the
+    data. The table is not modified.
+    :param table: Dataframe with the columns, the weights and HHNR (and ZIELPNR for data about persons)
+    :param weights: Column with the weights
+    :param list_of_columns: Columns whose weighted average is computed
+    :param segments: Dictionary with the name of a segment and a boolean array selecting its rows (segments can
+    overlap), e.g., {'Employees': table['work_position'] == 2} (None: the whole table)
+    :param groupby: Column or list of columns splitting each segment in groups (None: no groups)
+    :param percentage: If True, the averages are shares of the sum of the averages of the columns (e.g., shares of the
+    modes), with the confidence interval of a proportion. Columns that are not in the table have a share of zero.
+    :return: A tidy dataframe with one row per segment, group and column, and the columns 'segment', the columns of
+    groupby, 'column', 'weighted average', 'confidence interval', 'nb of observations' and 'sum of weights'
+    """
+    df_sums = get_weighted_sums(table, weights, list_of_columns, segments=segments, groupby=groupby)
+    return get_weighted_avg_and_ci_from_sums(df_sums, percentage=percentage,
+                                             list_of_columns=list_of_columns if percentage else None)
+
+
+def get_weighted_sums(table, weights, list_of_columns, segments=None, groupby=None):
+    """ Sums needed for weighted averages and standard deviations, for all segments, groups and columns at once: the
+    sum of the weights, the weighted sum and the weighted sum of squares of each column, and the number of
+    observations. The weights of the rows in each segment and group form a matrix (one column per segment and group),
+    so that all sums are computed with two matrix products. As with numpy.average, a missing value in a segment and
+    group makes its average missing.
+    :return: A tidy dataframe with one row per segment, group and column of the table (see get_weighted_avg_and_ci)
+    """
+    list_of_columns = [column for column in list_of_columns if column in table]
+    segment_names, segment_matrix = get_segment_matrix(table, segments, groupby)
+    nb_of_segments = segment_matrix.shape[1]
+    weights_of_segments = segment_matrix * table[weights].to_numpy(dtype=float)[:, np.newaxis]
+    values = table[list_of_columns].to_numpy(dtype=float)
+    is_missing = np.isnan(values)
+    values = np.where(is_missing, 0.0, values)
+    weighted_sums = weights_of_segments.T @ values
+    weighted_sums_of_squares = weights_of_segments.T @ (values ** 2)
+    has_missing_values = (segment_matrix.T @ is_missing.astype(float)) > 0
+    weighted_sums[has_missing_values] = np.nan
+    weighted_sums_of_squares[has_missing_values] = np.nan
+    nb_of_columns = len(list_of_columns)
+    df_sums = segment_names.loc[segment_names.index.repeat(nb_of_columns)].reset_index(drop=True)
+    df_sums['column'] = list_of_columns * nb_of_segments
+    df_sums['sum of weights'] = np.repeat(weights_of_segments.sum(axis=0), nb_of_columns)
+    df_sums['weighted sum'] = weighted_sums.ravel()
+    df_sums['weighted sum of squares'] = weighted_sums_of_squares.ravel()
+    df_sums['nb of observations'] = np.repeat(get_nb_of_observations_by_segment(table, segment_matrix),
+                                              nb_of_columns)
+    return df_sums
+
+
+def get_weighted_avg_and_ci_from_sums(df_sums, percentage=False, list_of_columns=None):
+    """ Weighted averages and confidence intervals from the sums of get_weighted_sums. The weighted standard deviation
+    is the one of weighted_avg_and_std (divided by the sum of the weights minus one).
+    :param list_of_columns: With percentage, columns that are not in the table and get a share of zero
+    """
+    df_stats = df_sums.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weighted_avg = df_stats['weighted sum'] / df_stats['sum of weights']
+        variance = (df_stats['weighted sum of squares'] - df_stats['weighted sum'] * weighted_avg) / \
+            (df_stats['sum of weights'] - 1)
+        nb_of_obs = df_stats['nb of observations'].astype(float)
+        if not percentage:
+            df_stats['weighted average'] = weighted_avg
+            df_stats['confidence interval'] = Z_VALUE_90_PERCENT * MAGIC_NUMBER * \
+                np.sqrt(np.maximum(variance, 0.0)) / np.sqrt(nb_of_obs)
+        else:
+            segment_columns = [column for column in df_stats.columns if column not in SUM_COLUMNS]
+            if list_of_columns is not None:
+                df_stats, is_missing_column = add_missing_columns(df_stats, segment_columns, list_of_columns)
+                weighted_avg = (df_stats['weighted sum'] / df_stats['sum of weights']).mask(is_missing_column, 0.0)
+                nb_of_obs = df_stats['nb of observations'].astype(float)
+            ''' As in the sum of the averages of weighted_avg_and_std, a missing average makes all shares missing '''
+            sum_all_columns = weighted_avg.groupby([df_stats[column] for column in segment_columns], sort=False,
+                                                   dropna=False).transform(lambda averages: averages.sum(skipna=False))
+            weighted_percentage = weighted_avg / sum_all_columns
+            df_stats['weighted average'] = weighted_percentage
+            df_stats['confidence interval'] = Z_VALUE_90_PERCENT * MAGIC_NUMBER * \
+                np.sqrt(weighted_percentage * (1.0 - weighted_percentage) / nb_of_obs)
+    return df_stats.drop(columns=['weighted sum', 'weighted sum of squares'])
+
+
+def add_missing_columns(df_sums, segment_columns, list_of_columns):
+    """ Rows with zero sums for the columns of list_of_columns that are not in the table, in each segment, in the
+    order of list_of_columns.
+    :return: The sums and a boolean series, True for the rows that were added
+    """
+    df_segments = df_sums[segment_columns + ['nb of observations']].drop_duplicates(segment_columns)
+    df_all_columns = df_segments.merge(pd.DataFrame({'column': list(list_of_columns)}), how='cross')
+    df_sums = df_all_columns.merge(df_sums.drop(columns='nb of observations'), on=segment_columns + ['column'],
+                                   how='left', indicator=True)
+    is_missing_column = df_sums.pop('_merge') == 'left_only'
+    df_sums.loc[is_missing_column, ['sum of weights', 'weighted sum', 'weighted sum of squares']] = 0.0
+    return df_sums, is_missing_column
+
+
+def get_segment_matrix(table, segments=None, groupby=None):
+    """ Matrix with one row per row of the table and one column per segment and group, equal to 1 if the row is in the
+    segment and the group.
+    :return: A dataframe with the name of each segment and the values of groupby in each group, and the matrix
+    """
+    if segments is None:
+        segments = {'Total': np.ones(len(table), dtype=bool)}
+    segment_names = list(segments)
+    segment_matrix = np.column_stack([np.asarray(segments[segment_name], dtype=bool)
+                                      for segment_name in segment_names])
+    df_segment_names = pd.DataFrame({'segment': segment_names})
+    if groupby is None:
+        return df_segment_names, segment_matrix.astype(float)
+    if isinstance(groupby, str):
+        groupby = [groupby]
+    group_codes, df_groups = pd.MultiIndex.from_frame(table[groupby]).factorize(sort=True)
+    df_groups = df_groups.to_frame(index=False)
+    df_groups.columns = groupby
+    nb_of_groups = len(df_groups)
+    group_matrix = np.zeros((len(table), nb_of_groups), dtype=bool)
+    has_group = group_codes >= 0  # Missing values of groupby are in no group
+    group_matrix[np.flatnonzero(has_group), group_codes[has_group]] = True
+    segment_matrix = (segment_matrix[:, :, np.newaxis] & group_matrix[:, np.newaxis, :]).reshape(len(table), -1)
+    df_segment_names = df_segment_names.loc[df_segment_names.index.repeat(nb_of_groups)].reset_index(drop=True)
+    df_segment_names = pd.concat([df_segment_names, pd.concat([df_groups] * len(segment_names), ignore_index=True)],
+                                 axis=1)
+    return df_segment_names, segment_matrix.astype(float)
+
+
+def get_identifiers(table):
+    """ Identifier of the observations: persons (HHNR and ZIELPNR) if ZIELPNR is in the table, otherwise households """
+    if 'ZIELPNR' in table:
+        return table['HHNR'].to_numpy(dtype=np.int64) * 10 + table['ZIELPNR'].to_numpy(dtype=np.int64)
+    return table['HHNR'].to_numpy(dtype=np.int64)
+
+
+def get_nb_of_observations(table):
+    return len(pd.unique(get_identifiers(table)))
+
+
+def get_nb_of_observations_by_segment(table, segment_matrix):
+    """ Number of different observations (persons or households) in each column of the segment matrix """
+    identifier_codes, unique_identifiers = pd.factorize(get_identifiers(table))
+    rows, segments = np.nonzero(segment_matrix)
+    unique_pairs = np.unique(segments.astype(np.int64) * len(unique_identifiers) + identifier_codes[rows])
+    return np.bincount(unique_pairs // max(len(unique_identifiers), 1), minlength=segment_matrix.shape[1])
 
 
 def weighted_avg_and_std(values, weights):
@@ -0,0 +1,96 @@
+import hashlib
+import importlib.util
+import json
+from pathlib import Path
+
+''' Keys of the stages already run and hashes of the files they used '''
+PATH_TO_STATE = Path('../data/output/pipeline/stages.json')
+
+
+def run_stages(stages, force=False, path_to_state=PATH_TO_STATE):
+    """ Run the stages of a pipeline in order, skipping the stages whose inputs, code and parameters did not change.
+    Each stage is a dictionary with:
+    - 'name': name of the stage,
+    - 'function': function running the stage, called with the parameters as keyword arguments,
+    - 'parameters': dictionary of parameters (optional),
+    - 'inputs': list of files read by the stage (optional),
+    - 'outputs': list of files written by the stage (optional),
+    - 'code': list of modules (e.g., 'choice_models.nb_trips.home_work_specification') defining the stage (optional).
+    The key of a stage is a hash of the content of its input files, of the source code of its modules and of its
+    parameters. A stage is run if its key changed since its last run or if one of its outputs is missing. Since the
+    key is computed just before the stage runs, a stage whose input is the output of a previous stage is only run
+    again if this output actually changed, e.g., a change in the utility specification only re-runs the estimation
+    and the stages using the estimated model, not the generation of the data.
+    :param stages: List of stages
+    :param force: If True, all stages are run
+    :param path_to_state: JSON file with the keys of the stages already run
+    :return: A dictionary with the key of each stage
+    """
+    state = read_state(path_to_state)
+    keys = {}
+    for stage in stages:
+        key = get_stage_key(stage, state['files'])
+        keys[stage['name']] = key
+        outputs_exist = all(Path(path_to_output).exists() for path_to_output in stage.get('outputs', []))
+        if not force and outputs_exist and state['stages'].get(stage['name']) == key:
+            print('Stage', stage['name'] + ': up to date, skipped')
+            continue
+        print('Stage', stage['name'] + ': running')
+        stage['function'](**stage.get('parameters', {}))
+        state['stages'][stage['name']] = key
+        ''' Saved after each stage, so that the stages already run are kept if a later stage fails '''
+        write_state(state, path_to_state)
+    return keys
+
+
+def get_stage_key(stage, file_hashes):
+    stage_hash = hashlib.md5()
+    for path_to_input in stage.get('inputs', []):
+        stage_hash.update(str(path_to_input).encode())
+        stage_hash.update(get_file_hash(Path(path_to_input), file_hashes).encode())
+    for module_name in stage.get('code', []):
+        stage_hash.update(module_name.encode())
+        stage_hash.update(get_file_hash(get_path_to_module(module_name), file_hashes).encode())
+    stage_hash.update(json.dumps(stage.get('parameters', {}), sort_keys=True, default=str).encode())
+    return stage_hash.hexdigest()
+
+
+def get_file_hash(path_to_file, file_hashes):
+    """ MD5 hash of the content of a file. The hash is kept in file_hashes with the modification time and the size of
+    the file, so that large files (e.g., the data of the MTMC) are only read again when they change.
+    :return: The hash of the file, or 'missing' if the file does not exist
+    """
+    if not path_to_file.exists():
+        return 'missing'
+    stat = path_to_file.stat()
+    known_hash = file_hashes.get(str(path_to_file))
+    if known_hash is not None and known_hash['mtime_ns'] == stat.st_mtime_ns and known_hash['size'] == stat.st_size:
+        return known_hash['md5']
+    file_hash = hashlib.md5()
+    with open(path_to_file, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(block)
+    file_hashes[str(path_to_file)] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                                      'md5': file_hash.hexdigest()}
+    return file_hash.hexdigest()
+
+
+def get_path_to_module(module_name):
+    """ Source file of a module, found without importing it """
+    module_spec = importlib.util.find_spec(module_name)
+    if module_spec is None or module_spec.origin is None:
+        raise Exception('Module ' + module_name + ' not well defined')
+    return Path(module_spec.origin)
+
+
+def read_state(path_to_state):
+    if not path_to_state.exists():
+        return {'stages': {}, 'files': {}}
+    with open(path_to_state, 'r') as state_file:
+        return json.load(state_file)
+
+
+def write_state(state, path_to_state):
+    path_to_state.parent.mkdir(parents=True, exist_ok=True)
+    with open(path_to_state, 'w') as state_file:
+        json.dump(state, state_file, indent=1)
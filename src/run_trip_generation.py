@@ -1,33 +1,210 @@
-import pandas as pd
+""" Trip generation: generation of the data, estimation, validation and application of the model of the number of
+trips from home to work, and descriptive statistics.
+
+Usage (from the folder src):
+    python run_trip_generation.py                 all stages of run_trip_generation
+    python run_trip_generation.py build-data      generation of the data file nb_trips.csv
+    python run_trip_generation.py estimate        estimation of the model (and generation of the data, if needed)
+    python run_trip_generation.py validate        validation of the model (and the stages before, if needed)
+    python run_trip_generation.py simulate        application of the model to the synthetic population
+    python run_trip_generation.py stats           descriptive statistics of the MTMC
+Heavy dependencies (pandas, pyreadstat, Biogeme, ...) are only imported by the subcommands that need them. With
+--timing, the time to import the modules of the subcommand (cold start) and the time to run it are printed.
+"""
+import argparse
+import importlib
+import sys
+import time
 from pathlib import Path
+from pipeline import run_stages
 # from choice_models.home_office.logit_home_office import estimate_choice_model_home_office
-import descriptive_statistics.from_microcensus
 # import descriptive_statistics.from_synpop
-from validate_choice_model import validate_choice_model
-from estimate_choice_model import estimate_choice_model
-# from apply_model_to_synthetic_population import apply_model_to_synthetic_population, \
-#     validate_model_with_synthetic_population
+# from validate_choice_model import cross_validate_choice_model
+# from apply_model_to_synthetic_population import validate_model_with_synthetic_population
 # from calibrate_the_cuts import calibrate_the_cuts_from_microcensus, calibrate_the_cuts_from_synthetic_population
+# from choice_models.nb_trips.model_artifact import get_model
+# from forecast_choice_model import forecast_choice_model
+
+''' Start of the program, for the cold start time of the subcommands '''
+START_TIME = time.perf_counter()
+''' Modules imported by get_function, with the time of their import (in seconds) '''
+_import_times = {}
 
 
-def run_trip_generation():
-    estimate_choice_model()
-    validate_choice_model()
+def run_trip_generation(use_cache=True):
+    # Generation of the data, estimation and validation, skipped if their inputs, code and parameters did not change
+    # (see pipeline.run_stages). Without cache: estimate_choice_model() and validate_choice_model()
+    run_stages(get_stages(), force=not use_cache)
+    # cross_validate_choice_model(nb_of_folds=5, nb_of_repetitions=10, nb_of_bootstrap_samples=100, seed=0)
     # estimate_choice_model_home_office()
+    # specification = get_model()['specification']
     # betas = calibrate_the_cuts_from_microcensus()
-    # validate_model_with_synthetic_population(betas)
-    # betas = calibrate_the_cuts_from_synthetic_population(betas)
-    # apply_model_to_synthetic_population(betas)
+    # validate_model_with_synthetic_population(betas, specification)
+    # betas = calibrate_the_cuts_from_synthetic_population(betas, specification=specification)
+    # apply_model_to_synthetic_population(betas, specification)
     # compute_descriptive_statistics()
     # predicting_2015_with_2010()
+    # forecast_choice_model([{'name': '2015'}, {'name': '2030', 'shares': {'working_from_home': 0.3}}])
     # # forecasting_2050()
 
 
-def compute_descriptive_statistics():
-    descriptive_statistics.from_microcensus.get_stats()
+def get_stages():
+    """ Stages of the trip generation, with the files they read and write and the modules defining them. The modules
+    of the stages are only imported when the stage runs (see get_lazy_function). """
+    from utils_spatial.commune_typology import PATH_TO_TYPOLOGY
+    path_to_mtmc = Path('../data/input/mtmc/2015/')
+    path_to_data_file = Path('../data/output/data/estimation/nb_trips.csv')
+    # The stages are keyed on the model artifact, which both engines rewrite at each estimation (Biogeme writes
+    # ordinalLogit~00.pickle, ... instead of overwriting ordinalLogit.pickle)
+    path_to_model_artifact = Path('../data/output/models/nb_trips/WA/estimation/ordinalLogit.json')
+    code_of_the_estimation = ['estimate_choice_model',
+                              'mtmc2015.utils2015.compute_confidence_interval',
+                              'choice_models.nb_trips.estimation.home_work',
+                              'choice_models.nb_trips.estimation.ordered_logit_native',
+                              'choice_models.nb_trips.home_work_specification',
+                              'choice_models.nb_trips.biogeme_specification',
+                              'choice_models.nb_trips.model_artifact',
+                              'features.business_sectors',
+                              'utils_mtmc.nb_trips_schema']
+    return [{'name': 'data',
+             'function': get_lazy_function('estimate_choice_model', 'generate_nb_trips_data_file'),
+             'inputs': [path_to_mtmc / 'MZMV_2015_Kombiniert_Analysen.sav',
+                        path_to_mtmc / 'zielpersonen.csv',
+                        path_to_mtmc / 'haushalte.csv',
+                        path_to_mtmc / 'haushaltspersonen.csv',
+                        PATH_TO_TYPOLOGY],
+             'outputs': [path_to_data_file],
+             'code': ['estimate_choice_model',
+                      'utils_mtmc.get_mtmc_files',
+                      'utils_mtmc.columnar_cache',
+                      'utils_spatial.commune_typology',
+                      'utils_spatial.distances',
+                      'utils_spatial.point_in_polygon',
+                      'features.household_composition',
+                      'features.business_sectors',
+                      'utils_mtmc.nb_trips_schema']},
+            {'name': 'estimation',
+             'function': get_lazy_function('estimate_choice_model', 'estimate_choice_model_on_nb_trips_data_file'),
+             'inputs': [path_to_data_file],
+             'outputs': [path_to_model_artifact],
+             'code': code_of_the_estimation},
+            {'name': 'validation',
+             'function': get_lazy_function('validate_choice_model', 'validate_choice_model'),
+             'inputs': [path_to_data_file, path_to_model_artifact],  # Starting values of the estimation
+             'parameters': {'seed': 0},  # Reproducible split of the data
+             'outputs': [Path('../data/output/models/nb_trips/WA/validation/simulation/'
+                              'nb_trips20_with_predicted_nb_trips.csv')],
+             'code': ['validate_choice_model',
+                      'choice_models.nb_trips.apply_home_work_model_to_microcensus',
+                      'choice_models.nb_trips.ordered_logit'] + code_of_the_estimation}]
+
+
+def compute_descriptive_statistics(use_cache=True):
+    get_function('descriptive_statistics.from_microcensus', 'get_stats')(use_cache=use_cache)
+
+
+def get_function(module_name, function_name):
+    """ Function of a module, imported the first time it is needed. The time of the import is kept in _import_times. """
+    if module_name not in sys.modules:
+        start_time = time.perf_counter()
+        importlib.import_module(module_name)
+        _import_times[module_name] = time.perf_counter() - start_time
+    return getattr(sys.modules[module_name], function_name)
+
+
+def get_lazy_function(module_name, function_name):
+    """ Function calling the function of a module, which is only imported when the function is called (e.g., the
+    function of a stage of the pipeline that is skipped is never imported) """
+    def lazy_function(**parameters):
+        return get_function(module_name, function_name)(**parameters)
+    return lazy_function
+
+
+def run_stages_up_to(last_stage_name, use_cache=True):
+    """ Run the stages of get_stages up to last_stage_name. The stages before are skipped if they are up to date. """
+    stages = get_stages()
+    stage_names = [stage['name'] for stage in stages]
+    run_stages(stages[:stage_names.index(last_stage_name) + 1], force=not use_cache)
+
+
+def run_command(arguments):
+    """ Run the subcommand of the command line """
+    use_cache = not arguments.no_cache
+    if arguments.command is None:
+        run_trip_generation(use_cache=use_cache)
+    elif arguments.command == 'build-data':
+        run_stages_up_to('data', use_cache=use_cache)
+    elif arguments.command == 'estimate':
+        run_stages_up_to('estimation', use_cache=use_cache)
+    elif arguments.command == 'validate':
+        if arguments.cross_validation:
+            get_function('validate_choice_model', 'cross_validate_choice_model')(
+                nb_of_folds=arguments.nb_of_folds, nb_of_repetitions=arguments.nb_of_repetitions,
+                nb_of_bootstrap_samples=arguments.nb_of_bootstrap_samples, seed=arguments.seed,
+                nb_of_processes=arguments.nb_of_processes)
+        else:
+            run_stages_up_to('validation', use_cache=use_cache)
+    elif arguments.command == 'simulate':
+        get_function('apply_model_to_synthetic_population', 'apply_model_to_synthetic_population')(
+            chunk_size=arguments.chunk_size, nb_of_processes=arguments.nb_of_processes)
+    elif arguments.command == 'stats':
+        compute_descriptive_statistics(use_cache=use_cache)
+    else:
+        raise Exception('Command not well defined')
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description='Trip generation in Switzerland: number of trips from home to work. '
+                                                 'Without subcommand, all stages of run_trip_generation are run.')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='run the stages even if their inputs, code and parameters did not change')
+    parser.add_argument('--timing', action='store_true',
+                        help='print the time to import the modules of the subcommand and to run it')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('build-data', help='generate the data file nb_trips.csv from the MTMC')
+    subparsers.add_parser('estimate', help='estimate the model (the data file is generated first, if needed)')
+    validate_parser = subparsers.add_parser('validate', help='validate the model (estimation on 80%% of the '
+                                                             'observations, simulation on the others)')
+    validate_parser.add_argument('--cross-validation', action='store_true',
+                                 help='k-fold cross-validation and bootstrap instead of one split')
+    validate_parser.add_argument('--nb-of-folds', type=int, default=5)
+    validate_parser.add_argument('--nb-of-repetitions', type=int, default=1)
+    validate_parser.add_argument('--nb-of-bootstrap-samples', type=int, default=0)
+    validate_parser.add_argument('--seed', type=int, default=0)
+    validate_parser.add_argument('--nb-of-processes', type=int, default=None,
+                                 help='number of processes (default: number of CPUs)')
+    simulate_parser = subparsers.add_parser('simulate', help='apply the model to the synthetic population')
+    simulate_parser.add_argument('--chunk-size', type=int, default=1000000,
+                                 help='number of persons simulated at once')
+    simulate_parser.add_argument('--nb-of-processes', type=int, default=None,
+                                 help='number of processes (default: number of CPUs)')
+    subparsers.add_parser('stats', help='descriptive statistics (trip rates) of the MTMC')
+    return parser
+
+
+def main(argv=None):
+    arguments = get_argument_parser().parse_args(argv)
+    start_time = time.perf_counter()
+    run_command(arguments)
+    if arguments.timing:
+        print_timing(start_time)
+
+
+def print_timing(start_time):
+    """ Time from the start of the program to the start of the subcommand, time to import its modules (cold start)
+    and time to run it """
+    run_time = time.perf_counter() - start_time
+    import_time = sum(_import_times.values())
+    print('Start of the program:', round(start_time - START_TIME, 3), 's')
+    for module_name, module_import_time in _import_times.items():
+        print('Import of', module_name + ':', round(module_import_time, 3), 's')
+    print('Cold start (imports of the subcommand):', round(import_time, 3), 's')
+    print('Run (without the imports):', round(run_time - import_time, 3), 's')
 
 
 def add_person_and_household_data(df_trips):
+    import pandas as pd
+    from utils_mtmc.get_mtmc_files import get_zp
     selected_columns = ['HHNR', 'tag']
     df_zp = get_zp(2015, selected_columns=selected_columns)
     df_trips = pd.merge(df_trips, df_zp, on='HHNR', how='left')
@@ -48,15 +225,12 @@ def decompose_round_trips_in_two_parts(df_trips):
 
 
 def add_urban_typology(df_trips):
-    # Read data from the Swiss Federal Statistical Office by commune
-    folder_path = Path('../data/input/StadtLandTypologie/2015/')
-    df_typology = pd.read_excel(folder_path / 'Raumgliederungen.xlsx', sheet_name='Daten', header=1)
-    df_typology = df_typology.iloc[1:]
-    df_typology.drop(['Gemeindename', 'Kantons-nummer', 'Kanton', 'Bezirks-nummer', 'Bezirksname'],
-                     axis=1, inplace=True)
-    df_trips = pd.merge(df_trips, df_typology, left_on='W_BFS', right_on='BFS Gde-nummer', how='left')
+    # Typologies from the Swiss Federal Statistical Office by commune, looked up by BFS commune number, or by the
+    # coordinates of home if the BFS commune number is not known
+    from utils_spatial.commune_typology import add_commune_typology
+    df_trips = add_commune_typology(df_trips, bfs_column='W_BFS', coordinate_columns=('W_Y_CH1903', 'W_X_CH1903'))
     return df_trips
 
 
 if __name__ == '__main__':
-    run_trip_generation()
+    main()
@@ -0,0 +1,80 @@
+import json
+import pandas as pd
+from pathlib import Path
+
+
+def read_csv_with_cache(path_to_csv, selected_columns=None, encoding=None, **read_csv_arguments):
+    """ Read a CSV file through a columnar (Parquet) copy stored in a 'cache' folder next to the CSV file.
+    The first call parses the whole CSV file once and saves it as Parquet. The next calls only read the selected
+    columns from the Parquet file. The cache is rebuilt when the modification time or the size of the CSV file change.
+    If pyarrow (or fastparquet) is not installed, the CSV file is read directly, as before.
+    :param path_to_csv: Path to the CSV file
+    :param selected_columns: List of columns to read (None: all columns)
+    :param encoding: Encoding of the CSV file
+    :param read_csv_arguments: Other arguments given to pandas.read_csv (dtype, delimiter, na_values, ...)
+    :return: A dataframe with the selected columns, in the order of the CSV file
+    """
+    path_to_csv = Path(path_to_csv)
+    if selected_columns is not None:
+        selected_columns = list(dict.fromkeys(selected_columns))  # Removes duplicated columns, as usecols does
+    if not parquet_is_available():
+        return _read_csv(path_to_csv, selected_columns, encoding, read_csv_arguments)
+    path_to_parquet, path_to_metadata = get_cache_paths(path_to_csv)
+    source_key = get_source_key(path_to_csv, read_csv_arguments)
+    metadata = read_cache_metadata(path_to_metadata)
+    if metadata is None or metadata['source'] != source_key or not path_to_parquet.exists():
+        df_full = _read_csv(path_to_csv, None, encoding, read_csv_arguments)
+        write_cached_table(df_full, path_to_parquet, path_to_metadata, source_key)
+        if selected_columns is None:
+            return df_full
+        return df_full[[column for column in df_full.columns if column in selected_columns]]
+    if selected_columns is None:
+        return pd.read_parquet(path_to_parquet)
+    missing_columns = [column for column in selected_columns if column not in metadata['columns']]
+    if missing_columns:
+        raise ValueError('Columns not in ' + path_to_csv.name + ': ' + str(missing_columns))
+    ''' Column projection: only the selected columns are read from disk, and returned in the order of the CSV file '''
+    return pd.read_parquet(path_to_parquet,
+                           columns=[column for column in metadata['columns'] if column in selected_columns])
+
+
+def _read_csv(path_to_csv, selected_columns, encoding, read_csv_arguments):
+    with open(path_to_csv, 'r', encoding=encoding) as csv_file:
+        return pd.read_csv(csv_file, usecols=selected_columns, **read_csv_arguments)
+
+
+def write_cached_table(df, path_to_parquet, path_to_metadata, source_key):
+    """ Save a dataframe as Parquet, together with a small JSON file describing the source it was built from """
+    path_to_parquet.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path_to_parquet, index=False)
+    with open(path_to_metadata, 'w') as metadata_file:
+        json.dump({'source': source_key, 'columns': [str(column) for column in df.columns]}, metadata_file)
+
+
+def read_cache_metadata(path_to_metadata):
+    if not path_to_metadata.exists():
+        return None
+    with open(path_to_metadata, 'r') as metadata_file:
+        return json.load(metadata_file)
+
+
+def get_cache_paths(path_to_source, suffix=''):
+    cache_folder = path_to_source.parent / 'cache'
+    return cache_folder / (path_to_source.stem + suffix + '.parquet'), \
+        cache_folder / (path_to_source.stem + suffix + '.json')
+
+
+def get_source_key(path_to_source, reading_arguments):
+    """ Key used to invalidate the cache: modification time and size of the source file, and how it was read """
+    stat = path_to_source.stat()
+    return {'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'arguments': json.loads(json.dumps(reading_arguments, default=str))}
+
+
+def parquet_is_available():
+    try:
+        pd.io.parquet.get_engine('auto')
+    except ImportError:
+        return False
+    return True
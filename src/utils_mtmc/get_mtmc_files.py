@@ -1,16 +1,20 @@
+import hashlib
+import json
+import os
 import pandas as pd
 from pathlib import Path
+from utils_mtmc.columnar_cache import read_csv_with_cache, get_cache_paths, get_source_key, read_cache_metadata, \
+    write_cached_table, parquet_is_available
 
 
 def get_trips(year, selected_columns=None):
     if year == 2015:
         folder_path = Path('../data/input/mtmc/2015/')
-        with open(folder_path / 'wege.csv', 'r') as trips_file:
-            df_trips = pd.read_csv(trips_file,
-                                   dtype={'HHNR': int},
-                                   delimiter=',',
-                                   usecols=selected_columns,
-                                   na_values=[-99])
+        df_trips = read_csv_with_cache(folder_path / 'wege.csv',
+                                       selected_columns=selected_columns,
+                                       dtype={'HHNR': int},
+                                       delimiter=',',
+                                       na_values=[-99])
     else:
         raise Exception('Year not well defined')
     return df_trips
@@ -19,13 +23,10 @@ def get_trips(year, selected_columns=None):
 def get_zp(year, selected_columns=None):
     if year == 2015:
         folder_path = Path('../data/input/mtmc/2015/')
-        with open(folder_path / 'zielpersonen.csv', 'r', encoding='latin1') as zielpersonen_file:
-            if selected_columns is None:
-                df_zp = pd.read_csv(zielpersonen_file)
-            else:
-                df_zp = pd.read_csv(zielpersonen_file,
-                                    dtype={'HHNR': int},
-                                    usecols=selected_columns)
+        df_zp = read_csv_with_cache(folder_path / 'zielpersonen.csv',
+                                    selected_columns=selected_columns,
+                                    encoding='latin1',
+                                    dtype={'HHNR': int})
     else:
         raise Exception('Year not well defined')
     return df_zp
@@ -34,21 +35,65 @@ def get_zp(year, selected_columns=None):
 def get_hh(year, selected_columns=None):
     if year == 2015:
         folder_path_2015 = Path('../data/input/mtmc/2015/')
-        with open(folder_path_2015 / 'haushalte.csv', 'r', encoding='latin1') as haushalte_file:
-            df_hh = pd.read_csv(haushalte_file,
-                                dtype={'HHNR': int},
-                                usecols=selected_columns)
+        df_hh = read_csv_with_cache(folder_path_2015 / 'haushalte.csv',
+                                    selected_columns=selected_columns,
+                                    encoding='latin1',
+                                    dtype={'HHNR': int})
+    else:
+        raise Exception('Year not well defined')
     return df_hh
 
 
 def get_hhp(year, selected_columns=None):
     if year == 2015:
         folder_path_2015 = Path('../data/input/mtmc/2015/')
-        with open(folder_path_2015 / 'haushaltspersonen.csv', 'r') as haushaltspersonen_file:
-            df_hhp = pd.read_csv(haushaltspersonen_file,
-                                 delimiter=',',
-                                 usecols=selected_columns,
-                                 na_values=[-99])
+        df_hhp = read_csv_with_cache(folder_path_2015 / 'haushaltspersonen.csv',
+                                     selected_columns=selected_columns,
+                                     delimiter=',',
+                                     na_values=[-99])
     else:
         raise Exception('Year not well defined')
     return df_hhp
+
+
+def get_trips_from_combined_analysis_file(year, selected_columns, weekdays_only=True, chunk_size=100000,
+                                          num_processes=None):
+    """ Read the trips from the cleaned version of the MTMC (MZMV_2015_Kombiniert_Analysen.sav).
+    Only the selected columns are read from the SPSS file, in chunks read by several processes. Weekend days are
+    removed from each chunk while reading, so that the full file is never in memory. The result is cached as Parquet
+    (one file per selection of columns and filter), rebuilt when the SPSS file changes.
+    :param year: Year of the MTMC (only 2015)
+    :param selected_columns: List of columns to read. 'tag' (day of the week) is always added.
+    :param weekdays_only: If True, only keep trips from Monday to Friday (tag <= 5)
+    :param chunk_size: Number of rows read at once
+    :param num_processes: Number of processes reading a chunk (None: number of CPUs)
+    :return: A dataframe with the selected columns
+    """
+    if year != 2015:
+        raise Exception('Year not well defined')
+    import pyreadstat
+    path_to_sav = Path('../data/input/mtmc/2015/MZMV_2015_Kombiniert_Analysen.sav')
+    selected_columns = list(dict.fromkeys(list(selected_columns) + ['tag']))
+    reading_arguments = {'columns': sorted(selected_columns), 'weekdays_only': weekdays_only}
+    selection_hash = hashlib.md5(json.dumps(reading_arguments).encode('utf-8')).hexdigest()[:10]
+    path_to_parquet, path_to_metadata = get_cache_paths(path_to_sav, suffix='_' + selection_hash)
+    source_key = get_source_key(path_to_sav, reading_arguments)
+    if parquet_is_available():
+        metadata = read_cache_metadata(path_to_metadata)
+        if metadata is not None and metadata['source'] == source_key and path_to_parquet.exists():
+            return pd.read_parquet(path_to_parquet)
+    if num_processes is None:
+        num_processes = os.cpu_count()
+    list_of_chunks = []
+    for df_chunk, meta in pyreadstat.read_file_in_chunks(pyreadstat.read_sav, str(path_to_sav),
+                                                         chunksize=chunk_size,
+                                                         multiprocess=num_processes > 1,
+                                                         num_processes=num_processes,
+                                                         usecols=selected_columns):
+        if weekdays_only:
+            df_chunk = df_chunk[df_chunk['tag'] <= 5]
+        list_of_chunks.append(df_chunk)
+    df_trips = pd.concat(list_of_chunks, ignore_index=True)
+    if parquet_is_available():
+        write_cached_table(df_trips, path_to_parquet, path_to_metadata, source_key)
+    return df_trips
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from features.business_sectors import BUSINESS_SECTOR_COLUMNS
+
+''' Number of trips per purpose (from - to) in the cleaned version of the MTMC, summed per person '''
+TRIP_PURPOSE_COLUMNS = ['WAA', 'WASK', 'WBS', 'WBU', 'WEk', 'WEl', 'WN', 'WBgK', 'WFk', 'WFl', 'AAW', 'ASKW', 'BSW',
+                        'BUW', 'EkW', 'ElW', 'NW', 'BgKW', 'FkW', 'FlW', 'AS', 'SA', 'AEkFk', 'EkFkA', 'EkFkEkFk', 'SS']
+
+''' Compact types of the columns of nb_trips.csv: survey codes (including -99, -98, -97 for no answer) are small
+integers and flags are booleans. Columns that are not in the schema (weights, distances, ...) keep their type. '''
+NB_TRIPS_SCHEMA = {**dict.fromkeys(TRIP_PURPOSE_COLUMNS + ['WA'], 'int8'),
+                   'HHNR': 'int32',
+                   'sex': 'int8',
+                   'age': 'int8',
+                   'labor_market_status': 'int8',
+                   'civil_status': 'int8',
+                   'nation': 'int16',
+                   'driving_license': 'int8',
+                   'halbtax_ticket': 'int8',
+                   'GA_ticket': 'int8',
+                   'GA_ticket_first_or_second': 'int8',
+                   'Verbund_Abo': 'int8',
+                   'Strecken_Abo': 'int8',
+                   'Gleis_7': 'int8',
+                   'anderes_Abo': 'int8',
+                   'bike_avail': 'int8',
+                   'moped_avail': 'int8',
+                   'small_moto_avail': 'int8',
+                   'moto_avail': 'int8',
+                   'car_avail': 'int8',
+                   'highest_educ': 'int8',
+                   'ERWERB': 'int8',
+                   'home_office': 'int8',
+                   'percentage_home_office': 'int8',
+                   'language': 'int8',
+                   'noga_08': 'int8',
+                   'full_part_time_job': 'int8',
+                   'percentage_first_part_time_job': 'int8',
+                   'percentage_second_part_time_job': 'int8',
+                   'hh_income': 'int8',
+                   'nb_car_in_hh': 'int8',
+                   'public_transport_connection_quality_ARE': 'int8',
+                   'hh_type': 'int16',
+                   'region': 'int8',
+                   'W_BFS': 'int16',
+                   'hh_size': 'int8',
+                   'city_typology': 'int8',
+                   'work_position': 'int8',
+                   'nb_less_than_6_in_hh': 'int8',
+                   'nb_less_than_15_in_hh': 'int8',
+                   'nb_adults_in_hh': 'int8',
+                   'nb_elderly_in_hh': 'int8',
+                   'nb_workers_in_hh': 'int8',
+                   **dict.fromkeys(BUSINESS_SECTOR_COLUMNS, 'bool')}
+''' Type of the columns of the schema with missing values, or with values out of the range of their type. Small
+integers are exact in float32. '''
+FALLBACK_DTYPE = 'float32'
+
+
+def apply_nb_trips_schema(df):
+    """ Convert the columns of df that are in NB_TRIPS_SCHEMA to their compact type. A column with missing values (or
+    with values that do not fit in its type) is converted to float32 instead, so that no value changes.
+    :return: A dataframe with the compact types
+    """
+    dtypes = {column: get_compact_dtype(df[column], dtype) for column, dtype in NB_TRIPS_SCHEMA.items()
+              if column in df}
+    dtypes = {column: dtype for column, dtype in dtypes.items() if df[column].dtype != dtype}
+    if not dtypes:
+        return df
+    return df.astype(dtypes)
+
+
+def get_compact_dtype(series, dtype):
+    values = series.to_numpy(dtype=float)
+    if np.isnan(values).any():
+        return FALLBACK_DTYPE
+    if dtype == 'bool':
+        return dtype if np.isin(values, [0, 1]).all() else FALLBACK_DTYPE
+    type_info = np.iinfo(dtype)
+    if len(values) > 0 and (values.min() < type_info.min or values.max() > type_info.max or
+                            not np.array_equal(values, np.round(values))):
+        return FALLBACK_DTYPE
+    return dtype
+
+
+def read_nb_trips(path_to_nb_trips, **read_csv_arguments):
+    """ Read nb_trips.csv (separator: ;) with the compact types of NB_TRIPS_SCHEMA. The columns of the schema are parsed
+    as float32 (half the memory of the default types) and then converted to their compact type. """
+    return apply_nb_trips_schema(pd.read_csv(path_to_nb_trips, sep=';',
+                                             dtype=dict.fromkeys(NB_TRIPS_SCHEMA, FALLBACK_DTYPE),
+                                             **read_csv_arguments))
+
+
+def write_nb_trips(df, path_to_nb_trips):
+    """ Save nb_trips.csv (separator: ;) with the compact types. Flags are written as 0 and 1, as before. """
+    df = apply_nb_trips_schema(df)
+    flag_columns = [column for column in df.columns if df[column].dtype == bool]
+    df.astype(dict.fromkeys(flag_columns, 'int8')).to_csv(path_to_nb_trips, sep=';', index=False)
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from utils_spatial.point_in_polygon import get_communes_of_points, PATH_TO_COMMUNE_BOUNDARIES
+
+PATH_TO_TYPOLOGY = Path('../data/input/StadtLandTypologie/2015/Raumgliederungen.xlsx')
+''' Columns of the sheet "Daten" that are not typologies '''
+NON_TYPOLOGY_COLUMNS = ['BFS Gde-nummer', 'Gemeindename', 'Kantons-nummer', 'Kanton', 'Bezirks-nummer', 'Bezirksname']
+MISSING_CODE = -1
+
+
+def get_commune_typology_index(path_to_typology=PATH_TO_TYPOLOGY):
+    """ Get the typologies of the Swiss Federal Statistical Office (FSO) for all communes as an array indexed by the BFS
+    commune number. The Excel file is only parsed once: the index is saved next to it (same name, extension .npz) and
+    rebuilt when the Excel file changes.
+    :param path_to_typology: Path to Raumgliederungen.xlsx
+    :return: The names of the typologies (list) and an array of codes (int16) with one row per BFS commune number
+    (from 0 to the largest number) and one column per typology. Numbers without commune get the code -1.
+    """
+    path_to_typology = Path(path_to_typology)
+    path_to_index = path_to_typology.with_suffix('.npz')
+    stat = path_to_typology.stat()
+    if path_to_index.exists():
+        with np.load(path_to_index) as index:
+            if index['source_mtime_ns'] == stat.st_mtime_ns and index['source_size'] == stat.st_size:
+                return list(index['columns']), index['codes']
+    df_typology = pd.read_excel(path_to_typology, sheet_name='Daten', header=1)
+    df_typology = df_typology.iloc[1:]  # Removes the row with links
+    df_typology = df_typology[df_typology['BFS Gde-nummer'].notna()]
+    typology_columns = [column for column in df_typology.columns if column not in NON_TYPOLOGY_COLUMNS]
+    bfs_numbers = df_typology['BFS Gde-nummer'].astype(int).to_numpy()
+    codes = np.full((bfs_numbers.max() + 1, len(typology_columns)), MISSING_CODE, dtype=np.int16)
+    ''' The codes are saved as text in the Excel file '''
+    codes[bfs_numbers] = df_typology[typology_columns].apply(pd.to_numeric, errors='coerce')\
+        .fillna(MISSING_CODE).to_numpy(dtype=np.int16)
+    np.savez(path_to_index, codes=codes, columns=np.array(typology_columns),
+             source_mtime_ns=stat.st_mtime_ns, source_size=stat.st_size)
+    return typology_columns, codes
+
+
+def get_typology_of_communes(bfs_numbers, typology_columns=None, path_to_typology=PATH_TO_TYPOLOGY):
+    """ Map BFS commune numbers to typology codes by direct indexing (no merge).
+    :param bfs_numbers: Array-like of BFS commune numbers (may contain NaN or unknown numbers)
+    :param typology_columns: List of typologies (None: all typologies of the Excel file)
+    :param path_to_typology: Path to Raumgliederungen.xlsx
+    :return: An array of codes (int16) with one row per commune number and one column per typology. Unknown communes get
+    the code -1.
+    """
+    all_typology_columns, codes = get_commune_typology_index(path_to_typology)
+    if typology_columns is None:
+        typology_columns = all_typology_columns
+    column_indices = [all_typology_columns.index(column) for column in typology_columns]
+    bfs_numbers = np.asarray(bfs_numbers, dtype=float)
+    is_known = np.isfinite(bfs_numbers) & (bfs_numbers >= 0) & (bfs_numbers < len(codes))
+    row_indices = np.where(is_known, bfs_numbers, 0).astype(np.int64)
+    typology_codes = codes[row_indices][:, column_indices]
+    typology_codes[~is_known] = MISSING_CODE
+    return typology_codes
+
+
+def add_commune_typology(df, bfs_column='W_BFS', typology_columns=None, path_to_typology=PATH_TO_TYPOLOGY,
+                         coordinate_columns=None, path_to_boundaries=PATH_TO_COMMUNE_BOUNDARIES):
+    """ Add the typologies of the commune given in bfs_column as new columns of df (same names as in the Excel file).
+    As with a left merge, communes that are not in the Excel file get NaN.
+    Data without BFS commune number (e.g., a synthetic population with coordinates only) can give the columns of the
+    coordinates, coordinate_columns=(east, north), e.g., ('W_Y_CH1903', 'W_X_CH1903'). The commune of the points
+    without BFS number is then found in the commune boundaries (see point_in_polygon.get_communes_of_points). If
+    geopandas or the boundary file is not available, a warning is printed and their typologies stay missing. """
+    if typology_columns is None:
+        typology_columns = get_commune_typology_index(path_to_typology)[0]
+    if bfs_column in df:
+        bfs_numbers = df[bfs_column].to_numpy(dtype=float, copy=True)
+    else:
+        bfs_numbers = np.full(len(df), np.nan)
+    if coordinate_columns is not None and np.isnan(bfs_numbers).any():
+        has_no_commune = np.isnan(bfs_numbers)
+        east_column, north_column = coordinate_columns
+        try:
+            bfs_numbers[has_no_commune] = get_communes_of_points(df[east_column].to_numpy()[has_no_commune],
+                                                                 df[north_column].to_numpy()[has_no_commune],
+                                                                 path_to_boundaries)
+        except (ImportError, FileNotFoundError) as error:
+            ''' The point-in-polygon search is optional (geopandas and the boundaries are not always available) '''
+            print('WARNING: The commune of', has_no_commune.sum(), 'rows without', bfs_column, 'is not known, their '
+                  'typology is missing (' + str(error) + ')')
+    typology_codes = get_typology_of_communes(bfs_numbers, typology_columns, path_to_typology)
+    for i, column in enumerate(typology_columns):
+        codes = typology_codes[:, i]
+        if (codes == MISSING_CODE).any():
+            df[column] = np.where(codes == MISSING_CODE, np.nan, codes)
+        else:
+            df[column] = codes
+    return df
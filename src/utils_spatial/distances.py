@@ -0,0 +1,60 @@
+import numpy as np
+
+''' Value of the coordinates of the MTMC when the place is not known (e.g., no work place) '''
+MISSING_COORDINATE = -999
+''' CH1903+/LV95 (EPSG:2056) = CH1903/LV03 (EPSG:21781) + (2 000 000, 1 000 000) meters '''
+LV95_OFFSET_EAST = 2000000.0
+LV95_OFFSET_NORTH = 1000000.0
+
+
+def get_planar_distances(east_from, north_from, east_to, north_to, missing_value=MISSING_COORDINATE):
+    """ Crow fly distances (in meters) between pairs of points in the Swiss coordinate systems CH1903/LV03
+    (EPSG:21781) or CH1903+/LV95 (EPSG:2056), computed with NumPy on the coordinate columns, without building
+    geometries. Both systems are planar, so that the distance is the one of geopandas (GeoSeries.distance). Points may be
+    in LV03 or in LV95, even mixed: points in LV03 are shifted to LV95 (see to_lv95).
+    :param east_from, north_from, east_to, north_to: Arrays (or series) of coordinates. In the MTMC, the east
+    coordinate is in the columns *_Y_CH1903 and the north coordinate in the columns *_X_CH1903.
+    :param missing_value: Value of unknown coordinates (missing values are also unknown)
+    :return: An array of distances, NaN if one of the coordinates of the pair is unknown
+    """
+    ''' Unknown coordinates are found before the shift to LV95, which would change the missing value of a coordinate
+    of a point in LV03 '''
+    is_missing = is_unknown(east_from, north_from, missing_value) | is_unknown(east_to, north_to, missing_value)
+    east_from, north_from = to_lv95(east_from, north_from)
+    east_to, north_to = to_lv95(east_to, north_to)
+    distances = np.hypot(east_to - east_from, north_to - north_from)
+    distances[is_missing] = np.nan
+    return distances
+
+
+def is_unknown(east, north, missing_value=MISSING_COORDINATE):
+    """ True for the points with an unknown (missing value or NaN) east or north coordinate """
+    east = np.asarray(east, dtype=float)
+    north = np.asarray(north, dtype=float)
+    return np.isnan(east) | np.isnan(north) | (east == missing_value) | (north == missing_value)
+
+
+def to_lv95(east, north):
+    """ Coordinates in CH1903+/LV95. Points in CH1903/LV03 (east coordinate lower than 1 000 000 m) are shifted, the
+    others (LV95 and missing values) are kept.
+    :return: Two arrays of floats
+    """
+    east = np.asarray(east, dtype=float)
+    north = np.asarray(north, dtype=float)
+    is_lv03 = (east > 0) & (east < 1000000.0)
+    return np.where(is_lv03, east + LV95_OFFSET_EAST, east), np.where(is_lv03, north + LV95_OFFSET_NORTH, north)
+
+
+def get_planar_distances_with_geopandas(east_from, north_from, east_to, north_to, crs='epsg:21781',
+                                        missing_value=MISSING_COORDINATE):
+    """ Same as get_planar_distances with geopandas (optional dependency), e.g., to check the results. All points
+    must be in the coordinate system crs. """
+    import geopandas
+    is_missing = is_unknown(east_from, north_from, missing_value) | is_unknown(east_to, north_to, missing_value)
+    points_from = geopandas.GeoSeries(geopandas.points_from_xy(np.asarray(east_from)[~is_missing],
+                                                               np.asarray(north_from)[~is_missing]), crs=crs)
+    points_to = geopandas.GeoSeries(geopandas.points_from_xy(np.asarray(east_to)[~is_missing],
+                                                             np.asarray(north_to)[~is_missing]), crs=crs)
+    distances = np.full(len(east_from), np.nan)
+    distances[~is_missing] = points_from.distance(points_to).to_numpy()
+    return distances
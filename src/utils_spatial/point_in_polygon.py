@@ -0,0 +1,81 @@
+import numpy as np
+from pathlib import Path
+from utils_spatial.distances import to_lv95, is_unknown, MISSING_COORDINATE
+
+''' Generalized boundaries of the communes of the Swiss Federal Statistical Office (FSO), state of 2015 '''
+PATH_TO_COMMUNE_BOUNDARIES = Path('../data/input/Gemeindegrenzen/2015/g1g15.shp')
+COMMUNE_ID_COLUMN = 'GMDNR'
+''' Coordinate system of the boundary files without one (CH1903/LV03, as the files of the FSO of 2015) '''
+BOUNDARIES_DEFAULT_EPSG = 21781
+''' Id of the points that are in no polygon or whose coordinates are not known '''
+MISSING_ID = -1
+''' Spatial indexes already built, by file and id column '''
+_polygon_indexes = {}
+
+
+def get_polygon_index(path_to_boundaries=PATH_TO_COMMUNE_BOUNDARIES, id_column=COMMUNE_ID_COLUMN):
+    """ Spatial index (STRtree of shapely) of the polygons of a boundary file (communes, traffic zones, ...), in
+    CH1903+/LV95 (files without coordinate system are assumed to be in CH1903/LV03). The file is read with geopandas
+    (optional dependency, only needed here) and the index is kept in memory as long as the file does not change.
+    :param path_to_boundaries: File with the polygons (e.g., shapefile)
+    :param id_column: Column with the integer id of each polygon (e.g., the BFS commune number)
+    :return: The STRtree and an array with the id of each polygon of the tree
+    """
+    import geopandas
+    from shapely import STRtree
+    path_to_boundaries = Path(path_to_boundaries)
+    stat = path_to_boundaries.stat()
+    index_key = (str(path_to_boundaries), id_column)
+    polygon_index = _polygon_indexes.get(index_key)
+    if polygon_index is None or polygon_index['source'] != (stat.st_mtime_ns, stat.st_size):
+        gdf_boundaries = geopandas.read_file(path_to_boundaries)
+        if gdf_boundaries.crs is None:
+            ''' File without coordinate system (e.g., no .prj file): the boundaries of the FSO are in CH1903/LV03 '''
+            print('WARNING: No coordinate system in ' + str(path_to_boundaries) + ', CH1903/LV03 (EPSG:21781) is '
+                  'assumed')
+            gdf_boundaries = gdf_boundaries.set_crs(epsg=BOUNDARIES_DEFAULT_EPSG)
+        if gdf_boundaries.crs.to_epsg() != 2056:
+            gdf_boundaries = gdf_boundaries.to_crs(epsg=2056)
+        polygon_index = {'source': (stat.st_mtime_ns, stat.st_size),
+                         'tree': STRtree(gdf_boundaries.geometry.to_numpy()),
+                         'ids': gdf_boundaries[id_column].to_numpy(dtype=np.int64)}
+        _polygon_indexes[index_key] = polygon_index
+    return polygon_index['tree'], polygon_index['ids']
+
+
+def assign_points_to_polygons(east, north, tree, ids, batch_size=1000000, missing_value=MISSING_COORDINATE):
+    """ Id of the polygon containing each point. The points are created and queried in the STRtree in batches of
+    batch_size points (vectorized in shapely), so that millions of points can be assigned with a bounded memory.
+    :param east, north: Coordinates in CH1903/LV03 or CH1903+/LV95 (see distances.to_lv95)
+    :param tree: STRtree of the polygons, in CH1903+/LV95 (see get_polygon_index)
+    :param ids: Id of each polygon of the tree
+    :param batch_size: Number of points queried at once
+    :param missing_value: Value of unknown coordinates (missing values are also unknown)
+    :return: An array (int64) with the id of the polygon of each point, MISSING_ID for points in no polygon or with
+    unknown coordinates. Points on the boundary of several polygons get the first of them.
+    """
+    import shapely
+    is_known = ~is_unknown(east, north, missing_value) & np.isfinite(east) & np.isfinite(north)
+    east, north = to_lv95(east, north)
+    known_positions = np.flatnonzero(is_known)
+    polygon_ids = np.full(len(east), MISSING_ID, dtype=np.int64)
+    for start in range(0, len(known_positions), batch_size):
+        positions = known_positions[start:start + batch_size]
+        points = shapely.points(east[positions], north[positions])
+        point_indices, polygon_indices = tree.query(points, predicate='intersects')
+        ''' One polygon per point: the first polygon (in the order of the file) '''
+        order = np.lexsort((polygon_indices, point_indices))
+        point_indices, polygon_indices = point_indices[order], polygon_indices[order]
+        first_hits = np.unique(point_indices, return_index=True)[1]
+        polygon_ids[positions[point_indices[first_hits]]] = ids[polygon_indices[first_hits]]
+    return polygon_ids
+
+
+def get_communes_of_points(east, north, path_to_boundaries=PATH_TO_COMMUNE_BOUNDARIES, id_column=COMMUNE_ID_COLUMN,
+                           batch_size=1000000):
+    """ BFS number of the commune (or id of the zone, with another boundary file) of each point
+    :return: An array of floats with NaN for points in no polygon, as a column of BFS numbers read from a CSV file
+    """
+    tree, ids = get_polygon_index(path_to_boundaries, id_column)
+    polygon_ids = assign_points_to_polygons(east, north, tree, ids, batch_size)
+    return np.where(polygon_ids == MISSING_ID, np.nan, polygon_ids)
@@ -1,21 +1,35 @@
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from choice_models.nb_trips.estimation.home_work import run_estimation_home_work
-from choice_models.nb_trips.apply_home_work_model_to_microcensus import apply_home_work_model_to_microcensus
-from mtmc2015.utils2015.compute_confidence_interval import get_weighted_avg_and_std
+from concurrent.futures import ProcessPoolExecutor
+from choice_models.nb_trips.estimation.home_work import run_estimation_home_work, get_starting_values, \
+    estimate_home_work_model
+from choice_models.nb_trips.home_work_specification import ESTIMATION_SPECIFICATION, get_design_matrix
+from choice_models.nb_trips.apply_home_work_model_to_microcensus import apply_home_work_model_to_microcensus, \
+    simulate_home_work_model
+from mtmc2015.utils2015.compute_confidence_interval import get_weighted_avg_and_ci
+from features.business_sectors import add_business_sectors
+from utils_mtmc.nb_trips_schema import read_nb_trips, write_nb_trips
 
+''' Data of a worker process of the cross-validation, sent once when the process starts '''
+_worker_data = {}
 
-def validate_choice_model():
+
+def validate_choice_model(seed=None):
     # Read the data used for estimation
     df_nb_trips = get_nb_trips()
     # Save 80% of the data for estimation and 20% of the data for simulation for simulation (and shuffles the data set)
-    save_slices(df_nb_trips)
+    save_slices(df_nb_trips, seed)
     # Estimate the model on 80% of the data
     data_file_directory_for_estimation = Path('../data/output/data/validation/estimation/')
     data_file_name_for_estimation = 'nb_trips80.csv'
     output_directory_for_estimation = Path('../data/output/models/nb_trips/WA/validation/estimation/')
+    # Starting from the estimation on the full sample, if available (same specification, similar data)
+    path_to_full_sample_results = Path('../data/output/models/nb_trips/WA/estimation/ordinalLogit.json')
     run_estimation_home_work(data_file_directory_for_estimation, data_file_name_for_estimation,
-                             output_directory_for_estimation)
+                             output_directory_for_estimation,
+                             path_to_starting_values=path_to_full_sample_results
+                             if path_to_full_sample_results.exists() else None)
     # Simulate the model on 20% of the data
     data_file_directory_for_simulation = Path('../data/output/data/validation/simulation/')
     data_file_name_for_simulation = 'nb_trips20.csv'
@@ -23,6 +37,7 @@ def validate_choice_model():
     output_file_name_for_simulation = 'nb_trips20_with_predicted_nb_trips.csv'
 
     path_to_estimation_folder = Path('../data/output/models/nb_trips/WA/validation/estimation/')
+    # The model is simulated with the betas and the specification saved by its estimation (see model_artifact.get_model)
     apply_home_work_model_to_microcensus(data_file_directory_for_simulation, data_file_name_for_simulation,
                                          output_directory_for_simulation, output_file_name_for_simulation,
                                          path_to_estimation_folder)
@@ -31,72 +46,273 @@ def validate_choice_model():
     compute_nb_trips()
 
 
+def validate_choice_model_in_memory(df_nb_trips=None, seed=None, share_for_estimation=0.8, starting_values=None,
+                                    save_outputs=False):
+    """ Same validation as validate_choice_model (estimation on 80% of the data, simulation on the other 20%,
+    comparison of the observed and predicted number of trips), without writing and reading back CSV files. The split
+    is a pair of arrays of row positions in df_nb_trips, and the model is estimated with the native engine. Both
+    validations simulate the model with ESTIMATION_SPECIFICATION, the specification it was estimated with.
+    :param df_nb_trips: Data of nb_trips.csv (None: read with get_nb_trips)
+    :param seed: Seed of the shuffle of the data
+    :param share_for_estimation: Share of the data used for estimation
+    :param starting_values: Dictionary of starting values of the betas
+    :param save_outputs: If True, the estimated parameters and the simulated probabilities are saved in the folders
+    of validate_choice_model (ordinalLogit_native.csv and nb_trips20_with_predicted_nb_trips.csv)
+    :return: The results of the estimation and the observed and predicted averages by population group
+    """
+    if df_nb_trips is None:
+        df_nb_trips = get_nb_trips()
+    if 'noga_08' in df_nb_trips:
+        df_nb_trips = add_business_sectors(df_nb_trips, noga_column='noga_08')
+    estimation_rows, simulation_rows = get_estimation_and_simulation_rows(len(df_nb_trips), share_for_estimation,
+                                                                          seed)
+    output_directory_for_estimation = None
+    if save_outputs:
+        output_directory_for_estimation = Path('../data/output/models/nb_trips/WA/validation/estimation/')
+    results, df_simulation = estimate_and_simulate(df_nb_trips, estimation_rows, simulation_rows,
+                                                   starting_values=starting_values,
+                                                   output_directory=output_directory_for_estimation)
+    if save_outputs:
+        output_directory_for_simulation = Path('../data/output/models/nb_trips/WA/validation/simulation/')
+        write_nb_trips(df_simulation.drop(columns='expected nb of trips'),
+                       output_directory_for_simulation / 'nb_trips20_with_predicted_nb_trips.csv')
+    observed_and_predicted = get_observed_and_predicted_nb_trips(df_simulation)
+    print_observed_and_predicted_nb_trips(observed_and_predicted)
+    return results, observed_and_predicted
+
+
+def estimate_and_simulate(df_nb_trips, estimation_rows, simulation_rows, weights=None, starting_values=None,
+                          design_matrix=None, output_directory=None):
+    """ Estimate the model on the rows estimation_rows of df_nb_trips and simulate it on the rows simulation_rows.
+    :param weights: Weight of each row of estimation_rows (see estimate_home_work_model)
+    :param design_matrix: Design matrix of all rows of df_nb_trips, if it is already computed
+    :param output_directory: Folder where the estimated parameters are saved (None: nothing is saved)
+    :return: The results of the estimation and the simulated rows with their probabilities and the column
+    'expected nb of trips'
+    """
+    results = estimate_home_work_model(df_nb_trips, estimation_rows, weights=weights, starting_values=starting_values,
+                                       design_matrix=design_matrix, output_directory=output_directory)
+    df_results = simulate_home_work_model(df_nb_trips, results['betas'], ESTIMATION_SPECIFICATION, simulation_rows)
+    df_simulation = pd.concat([df_nb_trips.iloc[simulation_rows], df_results], axis=1)
+    return results, df_simulation
+
+
+def get_estimation_and_simulation_rows(nb_of_observations, share_for_estimation=0.8, seed=None):
+    """ Positions of the rows used for estimation and for simulation, after a shuffle of the data (as save_slices) """
+    shuffled_rows = np.random.default_rng(seed).permutation(nb_of_observations)
+    nb_of_observations_for_estimation = round(share_for_estimation * nb_of_observations)
+    return np.sort(shuffled_rows[:nb_of_observations_for_estimation]), \
+        np.sort(shuffled_rows[nb_of_observations_for_estimation:])
+
+
 def compute_nb_trips():
     ''' Get the data '''
     simulation_results_directory = Path('../data/output/models/nb_trips/WA/validation/simulation/')
     data_file_name = 'nb_trips20_with_predicted_nb_trips.csv'
     df_persons = pd.read_csv(simulation_results_directory / data_file_name, sep=';')
-    ''' Compare the number of trips in the total population '''
-    print('--- Total population ---')
-    print('Observed average number of trips:', df_persons['WA'].mean())
     df_persons['expected nb of trips'] = df_persons['1'] + 2 * df_persons['2'] + 3 * df_persons['3'] + \
                                          4 * df_persons['4']
-    print('Predicted average number of trips:', df_persons['expected nb of trips'].mean())
-    ''' Compare the number of trips among employees '''
-    print('--- Employees ---')
-    df_persons_employees = df_persons[(df_persons['work_position'] == 2)]
-    print('Number of observations:', len(df_persons_employees))
-    weighted_avg_and_std_observed = get_weighted_avg_and_std(df_persons_employees, weights='WP', list_of_columns=['WA'])
-    avg_nb_trips_observed = round(weighted_avg_and_std_observed[0]['WA'][0], 3)
-    std_nb_trips_observed = round(weighted_avg_and_std_observed[0]['WA'][1], 3)
-    print('Observed average number of trips:', avg_nb_trips_observed, '(+/-' + str(std_nb_trips_observed) + ')')
-    weighted_avg_and_std_predicted = get_weighted_avg_and_std(df_persons_employees,
-                                                              weights='WP', list_of_columns=['expected nb of trips'])
-    avg_nb_trips_predicted = round(weighted_avg_and_std_predicted[0]['expected nb of trips'][0], 3)
-    std_nb_trips_predicted = round(weighted_avg_and_std_predicted[0]['expected nb of trips'][1], 3)
-    print('Predicted average number of trips:', avg_nb_trips_predicted, '(+/-' + str(std_nb_trips_predicted) + ')')
-    ''' Compare the number of trips in the population group PG 1 '''
-    print('--- Employees, younger than 24, with car available, without PT subscription ---')
-    # Add a column for having any kind of public transport subscription
-    df_persons.loc[(df_persons['GA_ticket'] == -99) | (df_persons['Verbund_Abo'] == -99), 'PT_subscription'] = -99
-    df_persons.loc[(df_persons['GA_ticket'] == 1) | (df_persons['Verbund_Abo'] == 1), 'PT_subscription'] = 1
-    df_persons.loc[(df_persons['GA_ticket'] == 2) & (df_persons['Verbund_Abo'] == 2), 'PT_subscription'] = 0
-    df_persons_employees_PG1 = df_persons[(df_persons['work_position'] == 2) &
-                                          (df_persons['age'] <= 24) &
-                                          (df_persons['PT_subscription'] == 0) & (df_persons['car_avail'].isin([1, 2]))]
-    print('Number of observations:', len(df_persons_employees_PG1))
-    weighted_avg_and_std_observed = get_weighted_avg_and_std(df_persons_employees_PG1,
-                                                             weights='WP', list_of_columns=['WA'])
-    avg_nb_trips_observed = round(weighted_avg_and_std_observed[0]['WA'][0], 3)
-    std_nb_trips_observed = round(weighted_avg_and_std_observed[0]['WA'][1], 3)
-    print('Observed average number of trips:', avg_nb_trips_observed, '(+/-' + str(std_nb_trips_observed) + ')')
-    weighted_avg_and_std_predicted = get_weighted_avg_and_std(df_persons_employees_PG1,
-                                                              weights='WP', list_of_columns=['expected nb of trips'])
-    avg_nb_trips_predicted = round(weighted_avg_and_std_predicted[0]['expected nb of trips'][0], 3)
-    std_nb_trips_predicted = round(weighted_avg_and_std_predicted[0]['expected nb of trips'][1], 3)
-    print('Predicted average number of trips:', avg_nb_trips_predicted, '(+/-' + str(std_nb_trips_predicted) + ')')
-
-
-def save_slices(df_nb_trips):
-    # Shuffle the data set (sampling the full fraction of the data, i.e., all data)
-    df_nb_trips = df_nb_trips.sample(frac=1)
+    print_observed_and_predicted_nb_trips(get_observed_and_predicted_nb_trips(df_persons))
+
+
+def print_observed_and_predicted_nb_trips(observed_and_predicted_by_population_group):
+    for population_group, observed_and_predicted in observed_and_predicted_by_population_group.items():
+        print('---', population_group, '---')
+        if population_group != 'Total population':
+            print('Number of observations:', observed_and_predicted['nb of observations'])
+            print('Observed average number of trips:', round(observed_and_predicted['observed'], 3),
+                  '(+/-' + str(round(observed_and_predicted['observed confidence interval'], 3)) + ')')
+            print('Predicted average number of trips:', round(observed_and_predicted['predicted'], 3),
+                  '(+/-' + str(round(observed_and_predicted['predicted confidence interval'], 3)) + ')')
+        else:
+            print('Observed average number of trips:', observed_and_predicted['observed'])
+            print('Predicted average number of trips:', observed_and_predicted['predicted'])
+
+
+def get_observed_and_predicted_nb_trips(df_persons):
+    """ Observed (WA) and predicted ('expected nb of trips') average number of trips to work in the total population
+    (not weighted) and, weighted with WP, among employees and in the population group PG 1.
+    The total population only has the persons older than 14, as children are not simulated.
+    :return: A dictionary with, for each population group, a dictionary with the observed and the predicted averages,
+    their confidence intervals and the number of observations
+    """
+    df_adults = df_persons[df_persons['age'] > 14]
+    observed_and_predicted = {'Total population': {'nb of observations': len(df_adults),
+                                                   'observed': df_adults['WA'].mean(),
+                                                   'observed confidence interval': None,
+                                                   'predicted': df_adults['expected nb of trips'].mean(),
+                                                   'predicted confidence interval': None}}
+    is_employee = (df_persons['work_position'] == 2).to_numpy()
+    ''' Employees, younger than 24, with car available, without PT subscription '''
+    # Any kind of public transport subscription
+    pt_subscription = pd.Series(float('nan'), index=df_persons.index)
+    pt_subscription[(df_persons['GA_ticket'] == -99) | (df_persons['Verbund_Abo'] == -99)] = -99
+    pt_subscription[(df_persons['GA_ticket'] == 1) | (df_persons['Verbund_Abo'] == 1)] = 1
+    pt_subscription[(df_persons['GA_ticket'] == 2) & (df_persons['Verbund_Abo'] == 2)] = 0
+    is_in_PG1 = is_employee & (df_persons['age'] <= 24).to_numpy() & (pt_subscription == 0).to_numpy() & \
+        df_persons['car_avail'].isin([1, 2]).to_numpy()
+    population_groups = {'Employees': is_employee,
+                         'Employees, younger than 24, with car available, without PT subscription': is_in_PG1}
+    ''' Observed and predicted averages of both population groups, in one pass over the data '''
+    df_stats = get_weighted_avg_and_ci(df_persons, weights='WP', list_of_columns=['WA', 'expected nb of trips'],
+                                       segments=population_groups).set_index(['segment', 'column'])
+    for population_group, is_in_population_group in population_groups.items():
+        observed_and_predicted[population_group] = {
+            'nb of observations': int(is_in_population_group.sum()),
+            'observed': df_stats.loc[(population_group, 'WA'), 'weighted average'],
+            'observed confidence interval': df_stats.loc[(population_group, 'WA'), 'confidence interval'],
+            'predicted': df_stats.loc[(population_group, 'expected nb of trips'), 'weighted average'],
+            'predicted confidence interval': df_stats.loc[(population_group, 'expected nb of trips'),
+                                                          'confidence interval']}
+    return observed_and_predicted
+
+
+def cross_validate_choice_model(nb_of_folds=5, nb_of_repetitions=1, nb_of_bootstrap_samples=0, seed=0,
+                                nb_of_processes=None):
+    """ Repeated k-fold cross-validation and bootstrap of the model of the number of trips to work.
+    Each cycle estimates the model on a part of the data (engine 'native', see estimation.ordered_logit_native) and
+    simulates it on the other part, then computes the observed and predicted averages of compute_nb_trips. The cycles
+    run at the same time in a pool of processes. The splits only depend on the seed, so that the figures are
+    reproducible.
+    - k-fold: the data is shuffled nb_of_repetitions times and split in nb_of_folds parts. Each part is simulated
+    with the model estimated on the other parts.
+    - bootstrap: the model is estimated on nb_of_bootstrap_samples samples drawn with replacement (persons drawn
+    several times are weighted in the log likelihood) and simulated on the persons that are not in the sample.
+    :param nb_of_folds: Number of parts of the k-fold cross-validation (0: no k-fold cross-validation)
+    :param nb_of_repetitions: Number of shuffles of the k-fold cross-validation
+    :param nb_of_bootstrap_samples: Number of bootstrap samples (0: no bootstrap)
+    :param seed: Seed of the random splits
+    :param nb_of_processes: Number of processes running the cycles (None: number of CPUs)
+    :return: A dataframe with the observed and predicted averages of each cycle and a dataframe with their
+    distributions (mean, standard deviation, 5% and 95% quantiles). Both are saved as CSV files.
+    """
+    df_nb_trips = get_nb_trips()
+    if 'noga_08' in df_nb_trips:
+        df_nb_trips = add_business_sectors(df_nb_trips, noga_column='noga_08')
+    # Starting from the estimation on the full sample, if available (same specification, similar data)
+    path_to_full_sample_results = Path('../data/output/models/nb_trips/WA/estimation/ordinalLogit.json')
+    starting_values = get_starting_values(path_to_full_sample_results) if path_to_full_sample_results.exists() \
+        else None
+    splits = get_cross_validation_splits(len(df_nb_trips), nb_of_folds, nb_of_repetitions, nb_of_bootstrap_samples,
+                                         seed)
+    with ProcessPoolExecutor(max_workers=nb_of_processes, initializer=_initialize_worker,
+                             initargs=(df_nb_trips, starting_values)) as executor:
+        list_of_results = list(executor.map(_run_validation_cycle_in_worker, splits))
+    df_cycles = pd.DataFrame([results for results_of_cycle in list_of_results for results in results_of_cycle])
+    df_cycles['difference'] = df_cycles['predicted'] - df_cycles['observed']
+    df_distributions = get_distributions(df_cycles)
+    print(df_distributions)
+    output_directory = Path('../data/output/models/nb_trips/WA/validation/cross_validation/')
+    df_cycles.to_csv(output_directory / 'cycles.csv', sep=';', index=False)
+    df_distributions.to_csv(output_directory / 'distributions.csv', sep=';')
+    return df_cycles, df_distributions
+
+
+def get_cross_validation_splits(nb_of_observations, nb_of_folds=5, nb_of_repetitions=1, nb_of_bootstrap_samples=0,
+                                seed=0):
+    """ Rows (positions) used for estimation and for simulation in each cycle of the cross-validation.
+    Each repetition and each bootstrap sample has its own random generator, derived from the seed, so that a cycle
+    does not depend on the number of other cycles.
+    :return: A list of dictionaries with the mode ('k-fold' or 'bootstrap'), the repetition, the fold, the positions of
+    the rows used for estimation, their weights (number of draws) and the positions of the rows used for simulation
+    """
+    if nb_of_folds == 1 or nb_of_folds > nb_of_observations:
+        raise Exception('Number of folds not well defined')
+    if nb_of_folds == 0 and nb_of_bootstrap_samples == 0:
+        raise Exception('Cross-validation not well defined: no fold and no bootstrap sample')
+    seed_sequence = np.random.SeedSequence(seed)
+    seeds_of_repetitions = seed_sequence.spawn(nb_of_repetitions)
+    seeds_of_bootstrap_samples = seed_sequence.spawn(nb_of_bootstrap_samples)
+    splits = []
+    if nb_of_folds > 0:
+        for repetition, seed_of_repetition in enumerate(seeds_of_repetitions):
+            shuffled_positions = np.random.default_rng(seed_of_repetition).permutation(nb_of_observations)
+            folds = np.array_split(shuffled_positions, nb_of_folds)
+            for fold, simulation_positions in enumerate(folds):
+                estimation_positions = np.sort(np.concatenate(folds[:fold] + folds[fold + 1:]))
+                splits.append({'mode': 'k-fold', 'repetition': repetition, 'fold': fold,
+                               'estimation': estimation_positions,
+                               'weights': np.ones(len(estimation_positions)),
+                               'simulation': np.sort(simulation_positions)})
+    for sample, seed_of_sample in enumerate(seeds_of_bootstrap_samples):
+        nb_of_draws = np.bincount(np.random.default_rng(seed_of_sample).integers(0, nb_of_observations,
+                                                                                 nb_of_observations),
+                                  minlength=nb_of_observations)
+        splits.append({'mode': 'bootstrap', 'repetition': sample, 'fold': 0,
+                       'estimation': np.flatnonzero(nb_of_draws > 0),
+                       'weights': nb_of_draws[nb_of_draws > 0].astype(float),
+                       'simulation': np.flatnonzero(nb_of_draws == 0)})
+    return splits
+
+
+def _initialize_worker(df_nb_trips, starting_values):
+    _worker_data['nb_trips'] = df_nb_trips
+    _worker_data['starting_values'] = starting_values
+    ''' The features do not depend on the split: they are computed once per process '''
+    _worker_data['design_matrix'] = get_design_matrix(df_nb_trips, ESTIMATION_SPECIFICATION)[1]
+
+
+def _run_validation_cycle_in_worker(split):
+    return run_validation_cycle(_worker_data['nb_trips'], split, _worker_data['starting_values'],
+                                _worker_data['design_matrix'])
+
+
+def run_validation_cycle(df_nb_trips, split, starting_values=None, design_matrix=None):
+    """ Estimate the model on the rows split['estimation'] and compare the observed and predicted number of trips on
+    the rows split['simulation'], in memory.
+    :return: A list of dictionaries, one per population group (see get_observed_and_predicted_nb_trips)
+    """
+    results, df_simulation = estimate_and_simulate(df_nb_trips, split['estimation'], split['simulation'],
+                                                   weights=split['weights'], starting_values=starting_values,
+                                                   design_matrix=design_matrix)
+    list_of_results = []
+    for population_group, observed_and_predicted in get_observed_and_predicted_nb_trips(df_simulation).items():
+        list_of_results.append({'mode': split['mode'], 'repetition': split['repetition'], 'fold': split['fold'],
+                                'population group': population_group,
+                                'nb of observations': observed_and_predicted['nb of observations'],
+                                'observed': observed_and_predicted['observed'],
+                                'predicted': observed_and_predicted['predicted'],
+                                'log likelihood': results['log likelihood']})
+    return list_of_results
+
+
+def get_distributions(df_cycles):
+    """ Mean, standard deviation, 5% and 95% quantiles of the observed and predicted averages and of their difference,
+    by mode (k-fold, bootstrap) and population group
+    """
+    grouped_cycles = df_cycles.groupby(['mode', 'population group'], sort=False)
+    df_distributions = grouped_cycles[['observed', 'predicted', 'difference']].agg(['mean', 'std'])
+    for quantile in [0.05, 0.95]:
+        df_quantiles = grouped_cycles[['observed', 'predicted', 'difference']].quantile(quantile)
+        df_quantiles.columns = pd.MultiIndex.from_product([df_quantiles.columns, [str(round(100 * quantile)) + '%']])
+        df_distributions = df_distributions.join(df_quantiles)
+    df_distributions = df_distributions[['observed', 'predicted', 'difference']]
+    df_distributions['nb of cycles'] = grouped_cycles.size()
+    return df_distributions
+
+
+def save_slices(df_nb_trips, seed=None):
+    # Shuffle the data set (sampling the full fraction of the data, i.e., all data). With a seed, the shuffle (and thus
+    # the validation) is reproducible.
+    df_nb_trips = df_nb_trips.sample(frac=1, random_state=seed)
     # Save 80% of the data for estimation
     estimation_output_directory = Path('../data/output/data/validation/estimation/')
     estimation_data_file_name = 'nb_trips80.csv'
     number_of_observations = len(df_nb_trips)
     first_80_percent_of_observations = round(0.8 * number_of_observations)
-    df_nb_trips.head(first_80_percent_of_observations).to_csv(estimation_output_directory / estimation_data_file_name,
-                                                              sep=';', index=False)
+    # Flags are written as 0 and 1, as in nb_trips.csv
+    write_nb_trips(df_nb_trips.head(first_80_percent_of_observations),
+                   estimation_output_directory / estimation_data_file_name)
     # Save the remaining 20% of the data for simulation
     last_20_percent_of_observations = number_of_observations - first_80_percent_of_observations
     simulation_output_directory = Path('../data/output/data/validation/simulation/')
     simulation_data_file_name = 'nb_trips20.csv'
-    df_nb_trips.tail(last_20_percent_of_observations).to_csv(simulation_output_directory / simulation_data_file_name,
-                                                             sep=';', index=False)
+    write_nb_trips(df_nb_trips.tail(last_20_percent_of_observations),
+                   simulation_output_directory / simulation_data_file_name)
 
 
 def get_nb_trips():
     full_sample_directory = Path('../data/output/data/estimation/')
     data_file_name = 'nb_trips.csv'
-    df_nb_trips = pd.read_csv(full_sample_directory / data_file_name, sep=';')
+    df_nb_trips = read_nb_trips(full_sample_directory / data_file_name)
     return df_nb_trips